@@ -0,0 +1,114 @@
+import hashlib
+import os
+import struct
+from os import path
+import pygame as pg
+from settings import ASSET_CACHE
+
+# Bumped whenever the layout of the files changes, which makes every old entry miss
+CACHE_VERSION = 1
+# width, height, bytes per pixel
+_HEADER = struct.Struct('<III')
+
+
+class AssetCache:
+    """
+    On disk cache of images after they have been converted and scaled.
+    The first time an image is loaded with a given list of transforms, the
+    pixels of the result are written to a file named after the image's path,
+    modification time and size, the transforms and the display's bit depth. On
+    later launches the surface is rebuilt from those pixels with
+    pg.image.frombuffer, skipping the PNG decode and any resampling. Editing an
+    image changes its modification time, so it misses the cache and is loaded
+    again.
+    """
+
+    def __init__(self, folder, enabled=ASSET_CACHE):
+        """
+        Creates an asset cache.
+        :param folder: The folder the cached pixels are kept in, created when first written to.
+        :param enabled: False to always load images from their files.
+        """
+        self.folder = folder
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _apply(surface, transforms):
+        """
+        Applies transforms to a surface in order.
+        :param surface: The surface to transform.
+        :param transforms: 'convert', 'convert_alpha' or ('smoothscale', (width, height)) steps.
+        :return: The transformed surface.
+        """
+        for transform in transforms:
+            if transform == 'convert':
+                surface = surface.convert()
+            elif transform == 'convert_alpha':
+                surface = surface.convert_alpha()
+            elif transform[0] == 'smoothscale':
+                surface = pg.transform.smoothscale(surface, transform[1])
+            else:
+                raise ValueError('Unknown transform {}'.format(transform))
+        return surface
+
+    def _entry(self, filename, transforms):
+        """
+        Finds the cache file of an image and its transforms.
+        :return: The path of the cache file.
+        """
+        info = os.stat(filename)
+        key = repr((CACHE_VERSION, path.abspath(filename), info.st_mtime_ns, info.st_size, transforms,
+                    pg.display.get_surface().get_bitsize()))
+        return path.join(self.folder, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.px')
+
+    def load(self, filename, *transforms):
+        """
+        Loads an image and applies transforms to it, or rebuilds the result from the cache.
+        :param filename: The image file.
+        :param transforms: The steps to apply after loading, as for pg.Surface.convert,
+        pg.Surface.convert_alpha and pg.transform.smoothscale. Defaults to 'convert_alpha'.
+        :return: The surface, converted to the display's format.
+        """
+        transforms = transforms or ('convert_alpha',)
+        try:
+            entry = self._entry(filename, transforms) if self.enabled else None
+        except OSError:
+            # Left for pg.image.load to report
+            entry = None
+        if entry is None:
+            return self._apply(pg.image.load(filename), transforms)
+        try:
+            with open(entry, 'rb') as cache:
+                data = cache.read()
+            width, height, depth = _HEADER.unpack_from(data)
+            if len(data) == _HEADER.size + width * height * depth:
+                self.hits += 1
+                surface = pg.image.frombuffer(data[_HEADER.size:], (width, height), 'RGBA' if depth == 4 else 'RGB')
+                return surface.convert_alpha() if depth == 4 else surface.convert()
+        except (OSError, struct.error):
+            pass
+
+        self.misses += 1
+        surface = self._apply(pg.image.load(filename), transforms)
+        alpha = surface.get_flags() & pg.SRCALPHA
+        pixels = pg.image.tobytes(surface, 'RGBA' if alpha else 'RGB')
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            # Written to a temporary file first so a half written entry is never read
+            with open(entry + '.tmp', 'wb') as cache:
+                cache.write(_HEADER.pack(surface.get_width(), surface.get_height(), 4 if alpha else 3))
+                cache.write(pixels)
+            os.replace(entry + '.tmp', entry)
+        except OSError:
+            # Such as a read only install; the image is still usable
+            pass
+        return surface
+
+    def stats(self):
+        """
+        Reports how well the cache is doing.
+        :return: A dictionary of hit and miss counts.
+        """
+        return {'hits': self.hits, 'misses': self.misses}
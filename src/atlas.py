@@ -0,0 +1,136 @@
+import pygame as pg
+from collections import OrderedDict
+from math import cos, sin, radians
+from settings import ENEMY_ROTATION_STEP, ENEMY_ROTATION_MEMORY, PLAYER_ROTATION_STEP, PLAYER_ROTATION_CACHE_SIZE
+
+
+class RotationAtlas:
+    """
+    Pre-rotated copies of a set of images.
+    Every image is rotated once at load time to every multiple of a fixed step,
+    so sprites can pick the frame nearest their heading instead of resampling
+    their image with pg.transform.rotozoom every frame. If the frames would take
+    more memory than allowed, the step is doubled until they fit.
+    """
+
+    def __init__(self, images, step=ENEMY_ROTATION_STEP, max_memory=ENEMY_ROTATION_MEMORY):
+        """
+        Builds the rotated frames of every image.
+        :param images: The list of images to rotate.
+        :param step: Degrees between neighbouring frames.
+        :param max_memory: Most bytes the frames may take.
+        """
+        self.max_memory = max_memory
+        self.step = step
+        while self.step < 360 and self.estimate(images, self.step) > max_memory:
+            self.step *= 2
+        self.count = max(1, int(round(360 / self.step)))
+        self.step = 360 / self.count
+        self.frames = [[pg.transform.rotozoom(image, idx * self.step, 1) for idx in range(self.count)]
+                       for image in images]
+        self.memory = sum(frame.get_width() * frame.get_height() * frame.get_bytesize()
+                          for frames in self.frames for frame in frames)
+
+    @staticmethod
+    def estimate(images, step):
+        """
+        Estimates the memory the frames of a set of images would take.
+        :param images: The list of images to rotate.
+        :param step: Degrees between neighbouring frames.
+        :return: The estimated number of bytes.
+        """
+        total = 0
+        count = max(1, int(round(360 / step)))
+        for image in images:
+            width, height = image.get_size()
+            for idx in range(count):
+                angle = radians(idx * 360 / count)
+                c, s = abs(cos(angle)), abs(sin(angle))
+                total += (width * c + height * s + 1) * (width * s + height * c + 1) * image.get_bytesize()
+        return int(total)
+
+    def get(self, image_idx, angle):
+        """
+        Finds the frame nearest an angle.
+        :param image_idx: The index of the image in the list the atlas was built from.
+        :param angle: The angle in degrees, as would be given to pg.transform.rotozoom.
+        :return: The rotated image.
+        """
+        return self.frames[image_idx][int(round(angle / self.step)) % self.count]
+
+    def stats(self):
+        """
+        Reports the size of the atlas.
+        :return: A dictionary of the frame count, angular step and memory use in bytes.
+        """
+        return {'frames': self.count * len(self.frames),
+                'step': self.step,
+                'memory': self.memory,
+                'max memory': self.max_memory}
+
+
+class RotationCache:
+    """
+    Least recently used cache of rotated images.
+    Angles are rounded to a fixed step and each (key, angle) pair is rotated the
+    first time it is asked for, so frames that are drawn again at an angle seen
+    recently cost a dictionary lookup instead of a resample. Once full, the entry
+    that went longest without being used is dropped.
+    """
+
+    def __init__(self, size=PLAYER_ROTATION_CACHE_SIZE, step=PLAYER_ROTATION_STEP):
+        """
+        Creates an empty rotation cache.
+        :param size: The most rotated images kept.
+        :param step: Degrees angles are rounded to.
+        """
+        self.size = size
+        self.step = step
+        # (key, angle index) -> (rotated image, its rect)
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def clear(self):
+        """
+        Removes every rotated image.
+        :return: None
+        """
+        self.frames.clear()
+
+    def get(self, key, image, angle):
+        """
+        Finds an image rotated to the nearest step of an angle, rotating it if it isn't cached.
+        :param key: Hashable identifying the image, such as (weapon, action, frame).
+        :param image: The unrotated image.
+        :param angle: The angle in degrees, as would be given to pg.transform.rotozoom.
+        :return: The rotated image and a copy of its rect.
+        """
+        angle_idx = int(round(angle / self.step)) % int(round(360 / self.step))
+        entry_key = (key, angle_idx)
+        entry = self.frames.get(entry_key)
+        if entry is None:
+            self.misses += 1
+            rotated = pg.transform.rotozoom(image, angle_idx * self.step, 1)
+            entry = (rotated, rotated.get_rect())
+            self.frames[entry_key] = entry
+            if len(self.frames) > self.size:
+                self.frames.popitem(last=False)
+        else:
+            self.hits += 1
+            self.frames.move_to_end(entry_key)
+        return entry[0], entry[1].copy()
+
+    def stats(self):
+        """
+        Reports how well the cache is doing.
+        :return: A dictionary of hit and miss counts, hit rate and size.
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit rate': self.hits / total if total else 0,
+                'size': len(self.frames)}
@@ -33,7 +33,7 @@ def world_shift_pos(position, camera):
     vector.y -= camera.y
     return vector
 
-def collide_with_obstacles(sprite, group, direction):
+def collide_with_obstacles(sprite, obstacles, direction):
     """
     Checks where the sprite has collided with an obstacle
     
@@ -42,14 +42,14 @@ def collide_with_obstacles(sprite, group, direction):
     was in a diagonal. Same goes for blocked vertical movement
     and continued horizontal movement.
     :param sprite: The sprite to check
-    :param group: The group of obstacles to check
+    :param obstacles: The StaticIndex of obstacles to check
     :param direction: For vertical or horizontal movement
     :return: True if there is a collision. False otherwise
     """
     collided = False
     if direction == 'x':
         collided = True
-        hits = pg.sprite.spritecollide(sprite, group, False, collide_hit_rect)
+        hits = obstacles.query_rect(sprite.hit_rect)
         if hits:
             # If the sprite is moving right, stop it and
             # set its right face on the left side of the object it collided with.
@@ -63,7 +63,7 @@ def collide_with_obstacles(sprite, group, direction):
             sprite.hit_rect.centerx = sprite.pos.x
     if direction == 'y':
         collided = True
-        hits = pg.sprite.spritecollide(sprite, group, False, collide_hit_rect)
+        hits = obstacles.query_rect(sprite.hit_rect)
         if hits:
             # If the sprite is moving upwards, then
             # set its top to the bottom of the sprite it collided with.
@@ -77,6 +77,38 @@ def collide_with_obstacles(sprite, group, direction):
     return collided
 
 
+def merge_rects(rects):
+    """
+    Merges rectangles which line up edge to edge into larger rectangles.
+    Rectangles in the same row with the same height that touch or overlap are
+    joined, then rectangles in the same column with the same width, until no
+    more can be joined. The merged rectangles cover exactly the same area.
+    :param rects: The rectangles to merge
+    :return: A list of the merged rectangles
+    """
+    rects = [pg.Rect(rect) for rect in rects]
+    count = None
+    while count != len(rects):
+        count = len(rects)
+        for horizontal in (True, False):
+            lines = {}
+            for rect in rects:
+                key = (rect.top, rect.height) if horizontal else (rect.left, rect.width)
+                lines.setdefault(key, []).append(rect)
+            rects = []
+            for line in lines.values():
+                line.sort(key=lambda rect: rect.left if horizontal else rect.top)
+                current = line[0]
+                for rect in line[1:]:
+                    if (rect.left if horizontal else rect.top) <= (current.right if horizontal else current.bottom):
+                        current = current.union(rect)
+                    else:
+                        rects.append(current)
+                        current = rect
+                rects.append(current)
+    return rects
+
+
 def get_image_names(path, index=2):
     files = [file for file in listdir(path) if isfile(join(path, file))]
     return [path + file for file in sorted(files, key=lambda x: int(re.split(r'[_.]', x)[index]))]
@@ -0,0 +1,116 @@
+import pygame as pg
+from settings import DIRTY_RECT_LIMIT
+
+
+class DirtyRects:
+    """
+    Keeps track of which parts of the screen changed between two frames.
+    Everything drawn is recorded under a key with its screen rect and a state,
+    such as its image. Comparing against the previous frame gives the rects that
+    have to be redrawn: where keys moved, changed state, appeared or disappeared,
+    plus any area that has to be redrawn every frame. If the camera has scrolled,
+    the whole screen has changed and a full redraw is asked for instead.
+    """
+
+    def __init__(self, screen_rect, limit=DIRTY_RECT_LIMIT):
+        """
+        Creates a tracker that asks for a full redraw on the first frame.
+        :param screen_rect: The pg.Rect of the screen.
+        :param limit: Fraction of the screen past which a full redraw is cheaper.
+        """
+        self.screen_rect = screen_rect
+        self.limit = limit
+        self.offset = None
+        # key -> (screen rect, state)
+        self.previous = {}
+        self.current = {}
+        self.areas = []
+        self.invalid = []
+        self.full = True
+
+    def begin(self, offset, force_full=False):
+        """
+        Starts a new frame.
+        :param offset: The (x, y) offset from world to screen coordinates.
+        :param force_full: True if the frame must be redrawn in full anyway.
+        :return: True if the whole screen has to be redrawn.
+        """
+        self.full = force_full or offset != self.offset
+        self.offset = offset
+        self.previous = self.current
+        self.current = {}
+        self.areas = []
+        return self.full
+
+    def add(self, key, rect, state=None):
+        """
+        Records something drawn this frame.
+        :param key: Hashable identifying it between frames, such as the sprite.
+        :param rect: The screen rect it covers.
+        :param state: Anything which changes its look without moving it, compared with ==.
+        :return: None
+        """
+        self.current[key] = (pg.Rect(rect), state)
+
+    def add_area(self, rect):
+        """
+        Marks a screen rect to be redrawn this frame whether or not it changed.
+        :param rect: The screen rect.
+        :return: None
+        """
+        self.areas.append(pg.Rect(rect))
+
+    def invalidate(self, rect):
+        """
+        Marks a world rect to be redrawn on the next frame, for when the map itself is drawn on.
+        :param rect: The world rect.
+        :return: None
+        """
+        self.invalid.append(pg.Rect(rect))
+
+    def rects(self):
+        """
+        Finds the screen rects to redraw this frame. Overlapping rects are joined.
+        :return: A list of rects, or None if a full redraw is needed.
+        """
+        if self.full:
+            self.invalid = []
+            return None
+        dirty = list(self.areas)
+        dirty.extend(rect.move(self.offset) for rect in self.invalid)
+        self.invalid = []
+        previous = self.previous
+        for key, entry in self.current.items():
+            old = previous.get(key)
+            if old is None:
+                dirty.append(entry[0])
+            elif old != entry:
+                dirty.append(entry[0])
+                dirty.append(old[0])
+        for key, entry in previous.items():
+            if key not in self.current:
+                dirty.append(entry[0])
+
+        screen = self.screen_rect
+        dirty = [rect.clip(screen) for rect in dirty]
+        dirty = self._join([rect for rect in dirty if rect.width and rect.height])
+        if sum(rect.width * rect.height for rect in dirty) > self.limit * screen.width * screen.height:
+            self.full = True
+            return None
+        return dirty
+
+    @staticmethod
+    def _join(rects):
+        """
+        Replaces overlapping rects by their union until none overlap.
+        :param rects: A list of rects.
+        :return: A list of rects which don't overlap.
+        """
+        joined = []
+        for rect in rects:
+            idx = rect.collidelist(joined)
+            while idx != -1:
+                rect = rect.union(joined.pop(idx))
+                idx = rect.collidelist(joined)
+            joined.append(rect)
+        return joined
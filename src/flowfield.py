@@ -0,0 +1,111 @@
+import heap
+from pathfinding import GridPathfinder
+from settings import TILESIZE, vec
+
+
+class FlowField:
+    """
+    Shared flow field rooted at a single target tile.
+    One Dijkstra search is run outwards from the target over the whole graph and
+    every reachable tile records which of its neighbours is one step closer to the
+    target. Any number of mobs can then steer towards the target by looking up the
+    tile they stand on, so the cost of pathfinding no longer depends on how many
+    mobs are chasing the player.
+    """
+
+    def __init__(self, graph):
+        """
+        Creates an empty flow field over a graph.
+        :param graph: The graph under consideration.
+        """
+        self.graph = graph
+        # Reuses the padded grid and edge cost tables of the A* engine
+        self.grid = GridPathfinder()
+        self.target = None
+        self.version = None
+        # For each node id, 0 if the node has no way to the target,
+        # otherwise 1 + the index of the step to take in self.grid.steps
+        self.directions = bytearray()
+        self.cost = {}
+
+    def update(self, target):
+        """
+        Recomputes the flow field if the target has changed tile or the graph has changed.
+        :param target: The (x, y) tile position of the target.
+        :return: True if the field was recomputed, False otherwise.
+        """
+        target = (int(target[0]), int(target[1]))
+        if target == self.target and self.graph.version == self.version:
+            return False
+        self.grid.prepare(self.graph)
+        self.target = target
+        self.version = self.graph.version
+        self.directions = bytearray(len(self.grid.blocked))
+        self.cost = {}
+        root = self.grid.node_id(target)
+        if root is None or self.grid.blocked[root]:
+            return True
+        self._search(root)
+        return True
+
+    def _search(self, root):
+        """
+        Dijkstra search outwards from the root. Edges are walked backwards,
+        so the cost of an edge is the cost of stepping onto the node nearer the root.
+        :param root: The node id of the target.
+        :return: None
+        """
+        blocked = self.grid.blocked
+        weights = self.grid.weights
+        steps = self.grid.steps
+        directions = self.directions
+        cost = self.cost
+        cost[root] = 0
+        frontier = heap.IndexedMinHeap()
+        frontier.push(root, 0)
+        while frontier:
+            current_cost, current = frontier.pop()
+            for direction, (offset, step_cost) in enumerate(steps):
+                next = current - offset
+                if blocked[next]:
+                    continue
+                next_cost = current_cost + step_cost + weights[current]
+                if next_cost < cost.get(next, next_cost + 1):
+                    cost[next] = next_cost
+                    # Taking step "direction" from next leads back to current
+                    directions[next] = direction + 1
+                    frontier.push(next, next_cost)
+
+    def _node_at(self, pos):
+        """
+        Finds the node id of the tile containing a world position.
+        :param pos: The world position.
+        :return: The node id, or None if the position is outside the graph.
+        """
+        if self.target is None:
+            return None
+        return self.grid.node_id((pos[0] // TILESIZE, pos[1] // TILESIZE))
+
+    def reaches(self, pos):
+        """
+        Determines whether the target can be reached from a world position.
+        :param pos: The world position.
+        :return: True if the field leads from pos to the target, False otherwise.
+        """
+        node = self._node_at(pos)
+        return node is not None and node in self.cost
+
+    def next_waypoint(self, pos):
+        """
+        Looks up where to head next from a world position.
+        :param pos: The world position.
+        :return: Vector2 of the centre of the next tile towards the target,
+                or None if pos is on the target tile or cannot reach it.
+        """
+        node = self._node_at(pos)
+        if node is None:
+            return None
+        direction = self.directions[node]
+        if not direction:
+            return None
+        return self.grid.to_world(node + self.grid.steps[direction - 1][0]) + vec(TILESIZE / 2, TILESIZE / 2)
@@ -1,29 +1,81 @@
+def _sift_up(heap, idx, higher_priority):
+    """
+    Moves the item at idx towards the root until its parent
+    no longer has a lower priority.
+    :param heap: The list of (cost, item) pairs
+    :param idx: The index of the item to move
+    :param higher_priority: Returns True if the first cost belongs above the second
+    :return: The final index of the item
+    """
+    current = heap[idx]
+    while idx > 0:
+        parent = (idx - 1) >> 1
+        if not higher_priority(current[0], heap[parent][0]):
+            break
+        heap[idx] = heap[parent]
+        idx = parent
+    heap[idx] = current
+    return idx
+
+
+def _sift_down(heap, idx, higher_priority):
+    """
+    Moves the item at idx towards the leaves until neither
+    of its children has a higher priority.
+    :param heap: The list of (cost, item) pairs
+    :param idx: The index of the item to move
+    :param higher_priority: Returns True if the first cost belongs above the second
+    :return: The final index of the item
+    """
+    n = len(heap)
+    current = heap[idx]
+    while True:
+        child = 2 * idx + 1
+        if child >= n:
+            break
+        if child + 1 < n and higher_priority(heap[child + 1][0], heap[child][0]):
+            child += 1
+        if not higher_priority(heap[child][0], current[0]):
+            break
+        heap[idx] = heap[child]
+        idx = child
+    heap[idx] = current
+    return idx
+
+
+def _lower(a, b):
+    return a < b
+
+
+def _higher(a, b):
+    return a > b
+
+
 def min_heap_push(heap, item, cost):
     """
     Inserts an item into the heap
-    and reheapifies according to min cost
+    and sifts it up according to min cost
     :param heap: The list of items
     :param item: The item to insert
     :param cost: The item priority
     :return: None
     """
     heap.append((cost, item))
-    min_heap(heap)
+    _sift_up(heap, len(heap) - 1, _lower)
 
 
 def min_heap_pop(heap):
     """
-    Pops an item from the heap
-    and reheapifies according to
-    min cost
+    Pops the item with the least cost from the heap
+    and sifts the last item down into its place
     :param heap: The list to pop an item from
-    :return: None
+    :return: The (cost, item) pair with the least cost
     """
     last_item = heap.pop()
     if heap:
         returnitem = heap[0]
         heap[0] = last_item
-        min_heap(heap)
+        _sift_down(heap, 0, _lower)
         return returnitem
     return last_item
 
@@ -34,46 +86,34 @@ def min_heap(heap):
     :param heap: The list to "heapify"
     :return: None
     """
-    n = len(heap)
-    for idx in range(n // 2, 0, -1):
-        key = idx
-        current = heap[key - 1]
-        while True and (2 * key) <= n:
-            child = 2 * key
-            if child < n:
-                if heap[child - 1][0] > heap[child][0]:
-                    child += 1
-            if current[0] < heap[child - 1][0]:
-                break
-            else:
-                heap[key - 1] = heap[child - 1]
-                key = child
-        heap[key - 1] = current
+    for idx in range(len(heap) // 2 - 1, -1, -1):
+        _sift_down(heap, idx, _lower)
 
 
 def max_heap_push(heap, item, cost):
     """
-    Pushes an item into the list and reheapifies that list
+    Pushes an item into the list and sifts it up according to max cost
     :param heap: The list of items
     :param item: The item to insert
     :param cost: The item priority
     :return: None
     """
     heap.append((cost, item))
-    max_heap(heap)
+    _sift_up(heap, len(heap) - 1, _higher)
 
 
 def max_heap_pop(heap):
     """
-    Pops an item from the list and reheapifies that list
+    Pops the item with the greatest cost from the list
+    and sifts the last item down into its place
     :param heap: The list of items
-    :return: None
+    :return: The (cost, item) pair with the greatest cost
     """
     last_item = heap.pop()
     if heap:
         returnitem = heap[0]
         heap[0] = last_item
-        max_heap(heap)
+        _sift_down(heap, 0, _higher)
         return returnitem
     return last_item
 
@@ -84,19 +124,116 @@ def max_heap(heap):
     :param heap: The list of items
     :return: None
     """
-    n = len(heap)
-    for idx in range(n // 2, 0, -1):
-        key = idx
-        current = heap[key - 1]
-        is_heap = False
-        while not is_heap and (2 * key) <= n:
-            child = 2 * key
-            if child < n:
-                if heap[child - 1][0] < heap[child][0]:
-                    child += 1
-            if current[0] >= heap[child - 1][0]:
-                is_heap = True
-            else:
-                heap[key - 1] = heap[child - 1]
-                key = child
-        heap[key - 1] = current
+    for idx in range(len(heap) // 2 - 1, -1, -1):
+        _sift_down(heap, idx, _higher)
+
+
+class IndexedMinHeap(object):
+    """
+    Binary min heap which remembers where each item sits.
+    Every item appears at most once, so pushing an item that is already
+    in the heap either lowers its cost in place or is ignored.
+    Items must be hashable.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty indexed heap.
+        """
+        self.heap = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def _swap(self, i, j):
+        """
+        Swaps two entries and updates their recorded positions.
+        :param i: Index of the first entry
+        :param j: Index of the second entry
+        :return: None
+        """
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.positions[heap[i][1]] = i
+        self.positions[heap[j][1]] = j
+
+    def _sift_up(self, idx):
+        heap = self.heap
+        while idx > 0:
+            parent = (idx - 1) >> 1
+            if heap[idx][0] >= heap[parent][0]:
+                break
+            self._swap(idx, parent)
+            idx = parent
+
+    def _sift_down(self, idx):
+        heap = self.heap
+        n = len(heap)
+        while True:
+            child = 2 * idx + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1][0] < heap[child][0]:
+                child += 1
+            if heap[child][0] >= heap[idx][0]:
+                break
+            self._swap(idx, child)
+            idx = child
+
+    def push(self, item, cost):
+        """
+        Inserts an item into the heap. If the item is already in
+        the heap, its cost is lowered when the new cost is smaller
+        and left alone otherwise.
+        :param item: The item to insert
+        :param cost: The item priority
+        :return: True if the heap changed, False otherwise
+        """
+        if item in self.positions:
+            return self.decrease_key(item, cost)
+        self.positions[item] = len(self.heap)
+        self.heap.append((cost, item))
+        self._sift_up(len(self.heap) - 1)
+        return True
+
+    def decrease_key(self, item, cost):
+        """
+        Lowers the cost of an item already in the heap.
+        :param item: The item to update
+        :param cost: The new item priority
+        :return: True if the cost was lowered, False otherwise
+        """
+        idx = self.positions[item]
+        if cost >= self.heap[idx][0]:
+            return False
+        self.heap[idx] = (cost, item)
+        self._sift_up(idx)
+        return True
+
+    def pop(self):
+        """
+        Removes the item with the least cost.
+        :return: The (cost, item) pair with the least cost
+        """
+        heap = self.heap
+        last_item = heap.pop()
+        if heap:
+            returnitem = heap[0]
+            heap[0] = last_item
+            self.positions[last_item[1]] = 0
+            del self.positions[returnitem[1]]
+            self._sift_down(0)
+            return returnitem
+        del self.positions[last_item[1]]
+        return last_item
+
+    def peek(self):
+        """
+        Retrieves the item with the least cost without removing it.
+        :return: The (cost, item) pair with the least cost
+        """
+        return self.heap[0]
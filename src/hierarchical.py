@@ -0,0 +1,298 @@
+import heap
+from pathfinding import GridPathfinder
+from settings import HPA_CLUSTER_SIZE
+
+
+class HierarchicalPathfinder(GridPathfinder):
+    """
+    Hierarchical A* (HPA*) over fixed size clusters of tiles.
+    When a level is loaded, the grid is split into square clusters. Every stretch of
+    open tiles along the border of two clusters gets one or two entrances, and the
+    cost between each pair of entrances in a cluster is found once. Paths are
+    found by searching this much smaller abstract graph of entrances first and then
+    filling in the tiles of only the clusters the route passes through, so large
+    levels cost far less than a search over the full grid. Paths are close to, but
+    not always exactly, the shortest.
+    """
+
+    def __init__(self, cache=None, cluster_size=HPA_CLUSTER_SIZE):
+        """
+        Creates a new hierarchical pathfinder.
+        :param cache: Optional PathCache consulted before searching.
+        :param cluster_size: The width and height of a cluster in tiles.
+        """
+        super(HierarchicalPathfinder, self).__init__(cache)
+        self.cluster_size = cluster_size
+        self.abstract_version = None
+        # entrance node id -> list of (entrance node id, cost)
+        self.edges = {}
+        # entrance node id -> {node id: parent node id} within its cluster
+        self.parents = {}
+        # (cluster x, cluster y) -> list of entrance node ids
+        self.entrances = {}
+
+    def prepare(self, graph):
+        """
+        Builds the padded grid and, if the graph has changed, the abstract graph of entrances.
+        :param graph: The graph under consideration.
+        :return: None
+        """
+        super(HierarchicalPathfinder, self).prepare(graph)
+        if self.abstract_version != graph.version:
+            self._build_abstract_graph()
+            self.abstract_version = graph.version
+
+    def _cluster_of(self, node):
+        """
+        Finds the cluster containing a node.
+        :param node: The node id.
+        :return: The (cluster x, cluster y) of the node.
+        """
+        y, x = divmod(node, self.width)
+        return (x - 1) // self.cluster_size, (y - 1) // self.cluster_size
+
+    def _cluster_bounds(self, cluster):
+        """
+        Finds the tiles a cluster spans, in padded grid coordinates.
+        :param cluster: The (cluster x, cluster y) of the cluster.
+        :return: (left, top, right, bottom) with right and bottom exclusive.
+        """
+        left = cluster[0] * self.cluster_size + 1
+        top = cluster[1] * self.cluster_size + 1
+        return (left, top,
+                min(left + self.cluster_size, self.graph.width + 1),
+                min(top + self.cluster_size, self.graph.height + 1))
+
+    def _add_entrance(self, node, other, cost, reverse_cost):
+        """
+        Adds a pair of entrance nodes on either side of a cluster border.
+        :param node: The node id on one side.
+        :param other: The node id on the other side.
+        :param cost: The cost of stepping from node to other.
+        :param reverse_cost: The cost of stepping from other to node.
+        :return: None
+        """
+        for a, b, step_cost in ((node, other, cost), (other, node, reverse_cost)):
+            if a not in self.edges:
+                self.edges[a] = []
+                self.entrances.setdefault(self._cluster_of(a), []).append(a)
+            self.edges[a].append((b, step_cost))
+
+    def _add_border_entrances(self, run, offset):
+        """
+        Adds the entrances for one stretch of open tiles along a cluster border.
+        Short stretches get one entrance in the middle, long ones one at each end.
+        :param run: The node ids on the near side of the border, in order.
+        :param offset: The node id offset to the matching node on the far side.
+        :return: None
+        """
+        if not run:
+            return
+        if len(run) < 6:
+            picks = [run[len(run) // 2]]
+        else:
+            picks = [run[0], run[-1]]
+        for node in picks:
+            # Like every other step, crossing costs the weight of the tile entered
+            self._add_entrance(node, node + offset, 10 + self.weights[node + offset], 10 + self.weights[node])
+
+    def _build_abstract_graph(self):
+        """
+        Finds the entrances between every pair of neighbouring clusters and the
+        cost of travelling between each pair of entrances in the same cluster.
+        :return: None
+        """
+        self.edges = {}
+        self.parents = {}
+        self.entrances = {}
+        blocked = self.blocked
+        width = self.width
+        graph_width = self.graph.width
+        graph_height = self.graph.height
+        size = self.cluster_size
+        # Vertical borders between horizontally neighbouring clusters
+        for border in range(size, graph_width, size):
+            for top in range(0, graph_height, size):
+                run = []
+                for y in range(top, min(top + size, graph_height)):
+                    node = (y + 1) * width + border
+                    if not blocked[node] and not blocked[node + 1]:
+                        run.append(node)
+                    else:
+                        self._add_border_entrances(run, 1)
+                        run = []
+                self._add_border_entrances(run, 1)
+        # Horizontal borders between vertically neighbouring clusters
+        for border in range(size, graph_height, size):
+            for left in range(0, graph_width, size):
+                run = []
+                for x in range(left, min(left + size, graph_width)):
+                    node = border * width + x + 1
+                    if not blocked[node] and not blocked[node + width]:
+                        run.append(node)
+                    else:
+                        self._add_border_entrances(run, width)
+                        run = []
+                self._add_border_entrances(run, width)
+        # Costs between entrances of the same cluster
+        for cluster, nodes in self.entrances.items():
+            for node in nodes:
+                cost, parents = self._cluster_search(node, cluster)
+                self.parents[node] = parents
+                for other in nodes:
+                    if other != node and other in cost:
+                        self.edges[node].append((other, cost[other]))
+
+    def _cluster_search(self, source, cluster, reverse=False):
+        """
+        Dijkstra search from a node over the tiles of a single cluster.
+        :param source: The node id to search from.
+        :param cluster: The (cluster x, cluster y) to stay within.
+        :param reverse: If True, costs are of travelling to source rather than from it.
+        :return: The cost and parent dictionaries of every node reached.
+        """
+        blocked = self.blocked
+        weights = self.weights
+        width = self.width
+        left, top, right, bottom = self._cluster_bounds(cluster)
+        cost = {source: 0}
+        parents = {source: source}
+        frontier = heap.IndexedMinHeap()
+        frontier.push(source, 0)
+        while frontier:
+            current_cost, current = frontier.pop()
+            for offset, step_cost in self.steps:
+                next = current + offset
+                if blocked[next]:
+                    continue
+                y, x = divmod(next, width)
+                if not (left <= x < right and top <= y < bottom):
+                    continue
+                next_cost = current_cost + step_cost + (weights[current] if reverse else weights[next])
+                if next_cost < cost.get(next, next_cost + 1):
+                    cost[next] = next_cost
+                    parents[next] = current
+                    frontier.push(next, next_cost)
+        return cost, parents
+
+    @staticmethod
+    def _walk(parents, node):
+        """
+        Follows parent links from a node back to the root of a search.
+        :param parents: The parent dictionary of the search.
+        :param node: The node id to start walking from.
+        :return: A list of node ids from node back to the root.
+        """
+        path = [node]
+        while parents[node] != node:
+            node = parents[node]
+            path.append(node)
+        return path
+
+    def _abstract_search(self, start, goal, expansions=None):
+        """
+        Searches the abstract graph with start and goal temporarily linked to
+        the entrances of their clusters. Like GridPathfinder.iter_search, this is a
+        generator which yields after every `expansions` abstract nodes are expanded.
+        :param start: The starting node id.
+        :param goal: The ending node id.
+        :param expansions: How many abstract nodes to expand between yields. None never yields.
+        :return: A generator which returns a list of node ids from start to goal along
+        the tiles, or None if there isn't one.
+        """
+        start_cluster = self._cluster_of(start)
+        goal_cluster = self._cluster_of(goal)
+        start_cost, start_parents = self._cluster_search(start, start_cluster)
+        goal_cost, goal_parents = self._cluster_search(goal, goal_cluster, True)
+        start_edges = [(node, start_cost[node]) for node in self.entrances.get(start_cluster, ())
+                       if node in start_cost]
+        goal_edges = {node: goal_cost[node] for node in self.entrances.get(goal_cluster, ())
+                      if node in goal_cost}
+
+        heuristic = self.heuristic
+        frontier = heap.IndexedMinHeap()
+        frontier.push(start, 0)
+        came_from = {start: start}
+        cost = {start: 0}
+        expanded = 0
+        while frontier:
+            current = frontier.pop()[1]
+            if current == goal:
+                break
+            edges = self.edges.get(current, [])
+            if current == start:
+                edges = start_edges + edges
+            if current in goal_edges:
+                edges = edges + [(goal, goal_edges[current])]
+            for next, edge_cost in edges:
+                next_cost = cost[current] + edge_cost
+                if next_cost < cost.get(next, next_cost + 1):
+                    cost[next] = next_cost
+                    came_from[next] = current
+                    frontier.push(next, next_cost + heuristic(next, goal))
+            expanded += 1
+            if expansions and expanded % expansions == 0:
+                yield
+        if goal not in came_from:
+            return None
+
+        route = self._walk(came_from, goal)
+        route.reverse()
+        # Fill in the tiles between each pair of consecutive abstract nodes
+        path = [start]
+        for node, next in zip(route, route[1:]):
+            if node == start and next in start_parents:
+                segment = self._walk(start_parents, next)
+                segment.reverse()
+            elif next == goal and node in goal_parents:
+                segment = self._walk(goal_parents, node)
+            elif next in self.parents[node]:
+                segment = self._walk(self.parents[node], next)
+                segment.reverse()
+            else:
+                # Crossing a border between two clusters
+                segment = [node, next]
+            path.extend(segment[1:])
+        return self._remove_loops(path)
+
+    @staticmethod
+    def _remove_loops(path):
+        """
+        Cuts out any part of a path that returns to a tile it has already visited.
+        :param path: A list of node ids.
+        :return: The path without loops.
+        """
+        seen = {}
+        result = []
+        for node in path:
+            if node in seen:
+                del result[seen[node] + 1:]
+                seen = {node: idx for idx, node in enumerate(result)}
+                continue
+            seen[node] = len(result)
+            result.append(node)
+        return result
+
+    def iter_search(self, start, goal, expansions=None):
+        """
+        Finds a path through the abstract graph of entrances and refines it.
+        Falls back to A* over the full grid if start and goal are within two clusters
+        of each other, where a local search is cheap and the detour through the
+        entrances would be at its worst, or if the abstract graph has no route, such
+        as one that only exists diagonally across the corner of a cluster.
+        :param start: The starting node id.
+        :param goal: The ending node id.
+        :param expansions: How many nodes to expand between yields, in the abstract
+        graph and in the full grid search if it is needed. None never yields.
+        :return: A generator which returns the came_from dictionary, or None if there is no path.
+        """
+        path = None
+        if self.heuristic(start, goal) >= 20 * self.cluster_size:
+            path = yield from self._abstract_search(start, goal, expansions)
+        if path is None:
+            came_from = yield from super(HierarchicalPathfinder, self).iter_search(start, goal, expansions)
+            return came_from
+        came_from = {start: start}
+        for node, next in zip(path, path[1:]):
+            came_from[next] = node
+        return came_from
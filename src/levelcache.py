@@ -0,0 +1,257 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from math import ceil
+from os import path
+import pygame as pg
+import pytmx
+from pytmx.util_pygame import pygame_image_loader
+from core_functions import merge_rects
+from pathfinding import WeightedGraph
+from settings import TILESIZE, GAME_LEVELS
+
+# Bumped whenever the layout of the file changes, which makes every old cache stale
+CACHE_VERSION = 1
+CACHE_EXTENSION = '.lvl'
+_MAGIC = b'TDLC'
+# magic, version, content hash, width, height, tile width, tile height, tile layers,
+# merged tile rects, collider rects, bullet collider rects, metadata length
+_HEADER = struct.Struct('<4sI20s9I')
+
+# An object placed on the level, such as a wall, spawn point or item
+LevelObject = namedtuple('LevelObject', 'name type x y width height')
+
+
+class TileLayer:
+    """
+    A tile layer read from a level cache. Like pytmx.TiledTileLayer, data[y][x] is
+    the gid of the tile at (x, y), and iterating gives (x, y, gid) for every tile.
+    """
+
+    def __init__(self, width, height, gids):
+        """
+        Creates a tile layer over a flat sequence of gids.
+        :param width: The width of the layer in tiles.
+        :param height: The height of the layer in tiles.
+        :param gids: The gids of every tile, row by row.
+        """
+        self.width = width
+        self.height = height
+        self.data = [gids[y * width:(y + 1) * width] for y in range(height)]
+
+    def __iter__(self):
+        for y, row in enumerate(self.data):
+            for x, gid in enumerate(row):
+                yield x, y, gid
+
+
+class CompiledLevel:
+    """
+    A level read from its binary cache, standing in for the pytmx.TiledMap of its
+    TMX file. The cache is memory mapped and the tile layers are read straight
+    out of it. The walls, the passability grid and the merged wall rects that
+    GameEngine.get_wall_positions would otherwise work out are stored in it too.
+    """
+
+    def __init__(self, filename, mapped):
+        """
+        Reads a level cache. The header must already have been checked by load_level.
+        :param filename: The TMX file the cache was built from.
+        :param mapped: The memory mapped cache.
+        """
+        self.filename = filename
+        self.mapped = mapped
+        (_, _, _, self.width, self.height, self.tilewidth, self.tileheight, layer_count,
+         tile_count, collider_count, bullet_count, meta_length) = _HEADER.unpack_from(mapped)
+        view = memoryview(mapped)
+        offset = _HEADER.size
+        tiles = self.width * self.height
+
+        gids = view[offset:offset + 4 * layer_count * tiles].cast('I')
+        offset += 4 * layer_count * tiles
+        self.layers = [TileLayer(self.width, self.height, gids[idx * tiles:(idx + 1) * tiles])
+                       for idx in range(layer_count)]
+        # Only visible tile layers are kept in the cache
+        self.visible_layers = self.layers
+
+        rect_count = tile_count + collider_count + bullet_count
+        values = view[offset:offset + 16 * rect_count].cast('i')
+        offset += 16 * rect_count
+        rects = [pg.Rect(tuple(values[idx:idx + 4])) for idx in range(0, 4 * rect_count, 4)]
+        grid = view[offset:offset + tiles]
+        offset += tiles
+        self.wall_layout = (grid, rects[:tile_count], rects[tile_count:tile_count + collider_count],
+                            rects[tile_count + collider_count:])
+
+        meta = json.loads(bytes(view[offset:offset + meta_length]).decode('utf-8'))
+        self.objects = [LevelObject(*obj) for obj in meta['objects']]
+        self.image_sources = meta['images']
+        self.images = []
+
+    def reload_images(self):
+        """
+        Loads the tile images with the same loader pytmx.load_pygame uses.
+        :return: None
+        """
+        folder = path.dirname(self.filename)
+        loaders = {}
+        images = []
+        for entry in self.image_sources:
+            if entry is None:
+                images.append(None)
+                continue
+            source, colorkey, rect, flags = entry
+            loader = loaders.get((source, colorkey))
+            if loader is None:
+                loader = pygame_image_loader(path.join(folder, source), colorkey)
+                loaders[(source, colorkey)] = loader
+            images.append(loader(tuple(rect) if rect else None, pytmx.TileFlags(*flags) if flags else None))
+        self.images = images
+
+    def get_tile_image_by_gid(self, gid):
+        return self.images[gid]
+
+
+def cache_path(filename):
+    """
+    Finds where the cache of a TMX file is kept.
+    :param filename: The TMX file.
+    :return: The path of its cache, next to it.
+    """
+    return path.splitext(filename)[0] + CACHE_EXTENSION
+
+
+def content_hash(filename):
+    """
+    Hashes everything a level cache is built from: the TMX file, the external
+    tilesets it uses and the version of the cache format.
+    :param filename: The TMX file.
+    :return: The 20 byte SHA-1 digest.
+    """
+    digest = hashlib.sha1('{} {}'.format(CACHE_VERSION, sys.byteorder).encode())
+    with open(filename, 'rb') as tmx:
+        data = tmx.read()
+    digest.update(data)
+    for source in re.findall(rb'<tileset[^>]*\ssource="([^"]+)"', data):
+        digest.update(source)
+        tileset = path.join(path.dirname(filename), source.decode('utf-8'))
+        if path.isfile(tileset):
+            with open(tileset, 'rb') as tsx:
+                digest.update(tsx.read())
+    return digest.digest()
+
+
+def build_wall_layout(width, height, walls, passable_walls):
+    """
+    Works out the impassable tiles of a level and merges its walls into larger rects.
+    :param width: The width of the level in tiles.
+    :param height: The height of the level in tiles.
+    :param walls: The rects of the walls bullets can't pass, in the order they were placed.
+    :param passable_walls: The rects of the walls bullets pass over, in the order they were placed.
+    :return: The passability grid, as used by Graph.set_grid, and the lists of merged
+    tile rects, merged rects of every wall and merged rects of the walls bullets can't pass.
+    """
+    walls = [pg.Rect(rect) for rect in walls]
+    passable_walls = [pg.Rect(rect) for rect in passable_walls]
+    graph = WeightedGraph(width, height)
+    for rect in walls + passable_walls:
+        # Number of tiles the wall spans in each direction
+        columns = max(1, ceil(rect.width / TILESIZE))
+        rows = max(1, ceil(rect.height / TILESIZE))
+        graph.mark_rect(rect.x // TILESIZE, rect.y // TILESIZE, columns, rows)
+    tiles = [(x * TILESIZE, y * TILESIZE, TILESIZE, TILESIZE) for x, y in graph.walls]
+    return bytes(graph.grid), merge_rects(tiles), merge_rects(walls + passable_walls), merge_rects(walls)
+
+
+def _recording_loader(filename, colorkey, **kwargs):
+    """
+    Image loader for pytmx which records where each tile image comes from instead of loading it.
+    """
+    def load(rect=None, flags=None):
+        return filename, colorkey, rect, flags
+    return load
+
+
+def compile_level(filename):
+    """
+    Parses a TMX file and writes its cache next to it.
+    :param filename: The TMX file.
+    :return: None
+    """
+    tmxdata = pytmx.TiledMap(filename, image_loader=_recording_loader)
+    layers = []
+    for layer in tmxdata.visible_layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            layers.append(layer)
+        elif not isinstance(layer, pytmx.TiledObjectGroup):
+            raise ValueError('{} has a {}, which the level cache can\'t store'.format(
+                filename, type(layer).__name__))
+
+    objects = [(obj.name, obj.type, obj.x, obj.y, obj.width, obj.height) for obj in tmxdata.objects]
+    walls = [pg.Rect(x, y, width, height) for name, kind, x, y, width, height in objects
+             if name == 'wall' and kind != 'passable']
+    passable_walls = [pg.Rect(x, y, width, height) for name, kind, x, y, width, height in objects
+                      if name == 'wall' and kind == 'passable']
+    grid, tiles, colliders, bullet_colliders = build_wall_layout(tmxdata.width, tmxdata.height,
+                                                                 walls, passable_walls)
+    folder = path.dirname(filename)
+    images = [None if image is None else
+              (path.relpath(image[0], folder), image[1], image[2], tuple(image[3]) if image[3] else None)
+              for image in tmxdata.images]
+    meta = json.dumps({'objects': objects, 'images': images}).encode('utf-8')
+
+    gids = array('I')
+    for layer in layers:
+        for row in layer.data:
+            gids.extend(row)
+    values = array('i')
+    for rect in tiles + colliders + bullet_colliders:
+        values.extend((rect.x, rect.y, rect.width, rect.height))
+
+    header = _HEADER.pack(_MAGIC, CACHE_VERSION, content_hash(filename), tmxdata.width, tmxdata.height,
+                          tmxdata.tilewidth, tmxdata.tileheight, len(layers), len(tiles), len(colliders),
+                          len(bullet_colliders), len(meta))
+    # Written to a temporary file first so a half written cache is never read
+    temporary = cache_path(filename) + '.tmp'
+    with open(temporary, 'wb') as cache:
+        cache.write(header)
+        cache.write(gids.tobytes())
+        cache.write(values.tobytes())
+        cache.write(grid)
+        cache.write(meta)
+    os.replace(temporary, cache_path(filename))
+
+
+def load_level(filename):
+    """
+    Memory maps the cache of a TMX file.
+    :param filename: The TMX file.
+    :return: The CompiledLevel, or None if there is no cache or it is stale.
+    """
+    try:
+        with open(cache_path(filename), 'rb') as cache:
+            mapped = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < _HEADER.size:
+        mapped.close()
+        return None
+    magic, version, digest = _HEADER.unpack_from(mapped)[:3]
+    if magic != _MAGIC or version != CACHE_VERSION or digest != content_hash(filename):
+        mapped.close()
+        return None
+    return CompiledLevel(filename, mapped)
+
+
+if __name__ == '__main__':
+    # Build step: python levelcache.py [maps folder]
+    maps_folder = sys.argv[1] if len(sys.argv) > 1 else path.join(path.dirname(__file__), '../data/img/maps')
+    for level in GAME_LEVELS:
+        compile_level(path.join(maps_folder, level))
+        print('Compiled', cache_path(path.join(maps_folder, level)))
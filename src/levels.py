@@ -0,0 +1,111 @@
+import threading
+from os import path
+import pytmx
+from pytmx.util_pygame import pygame_image_loader
+from levelcache import compile_level, load_level
+from settings import GAME_LEVELS, LEVEL_CACHE
+from tilemap import TiledMap
+
+
+class LevelManager:
+    """
+    Loads the levels of the game as they are needed.
+    Only the level about to be played is loaded. While it is played, the next
+    level is read in a background thread, and every level loaded is kept, so
+    starting a level again after dying doesn't read its file again. Levels are
+    read from their binary cache when it's up to date, see levelcache, and from
+    their TMX file otherwise. Tile images are only loaded on the main thread,
+    when the level is first played.
+    """
+
+    def __init__(self, folder, levels=GAME_LEVELS, use_cache=LEVEL_CACHE):
+        """
+        Creates a level manager without loading any levels.
+        :param folder: The folder containing the TMX files.
+        :param levels: The file names of the levels, in the order they are played.
+        :param use_cache: True to read levels from their binary caches, rebuilding stale ones.
+        """
+        self.folder = folder
+        self.levels = list(levels)
+        self.use_cache = use_cache
+        # level index -> TiledMap with its images loaded
+        self.maps = {}
+        # level index -> CompiledLevel or pytmx.TiledMap read in the background, without images
+        self.parsed = {}
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.levels)
+
+    def _filename(self, idx):
+        return path.join(self.folder, self.levels[idx])
+
+    def _read(self, idx):
+        """
+        Reads a level without loading its images. If the level's cache is stale
+        it's read from the TMX file and the cache is rebuilt.
+        :param idx: The index of the level.
+        :return: The CompiledLevel, or the pytmx.TiledMap if the level can't be cached.
+        """
+        filename = self._filename(idx)
+        if self.use_cache:
+            tmxdata = load_level(filename)
+            if tmxdata is None:
+                try:
+                    compile_level(filename)
+                except (OSError, ValueError):
+                    # Such as a read only folder, or a layer the cache can't store
+                    pass
+                else:
+                    tmxdata = load_level(filename)
+            if tmxdata is not None:
+                return tmxdata
+        return pytmx.TiledMap(filename)
+
+    def _parse(self, idx):
+        """
+        Reads a level without loading its images. Run in a background thread.
+        :param idx: The index of the level.
+        :return: None
+        """
+        tmxdata = self._read(idx)
+        with self.lock:
+            self.parsed[idx] = tmxdata
+
+    def prefetch(self, idx):
+        """
+        Starts parsing a level in the background, unless it's already loaded or being parsed.
+        :param idx: The index of the level.
+        :return: None
+        """
+        if not 0 <= idx < len(self.levels) or idx in self.maps or idx in self.threads:
+            return
+        thread = threading.Thread(target=self._parse, args=(idx,), daemon=True)
+        self.threads[idx] = thread
+        thread.start()
+
+    def get(self, idx):
+        """
+        Finds a level, loading it if it hasn't been already, and starts parsing the level after it.
+        :param idx: The index of the level.
+        :return: The TiledMap of the level.
+        """
+        level = self.maps.get(idx)
+        if level is None:
+            thread = self.threads.pop(idx, None)
+            if thread is not None:
+                thread.join()
+            with self.lock:
+                tmxdata = self.parsed.pop(idx, None)
+            if tmxdata is None:
+                # Not prefetched, or reading it in the background failed
+                tmxdata = self._read(idx)
+            if isinstance(tmxdata, pytmx.TiledMap):
+                # Same images as pytmx.load_pygame would load
+                tmxdata.image_loader = pygame_image_loader
+            tmxdata.reload_images()
+            level = TiledMap(self._filename(idx), tmxdata)
+            self.maps[idx] = level
+        self.prefetch(idx + 1)
+        return level
@@ -0,0 +1,286 @@
+import pygame as pg
+from math import atan2, cos, sin, pi
+import PAdLib.occluder as occluder
+import PAdLib.shadow as shadow
+from PAdLib.math_helpers import rndint
+from settings import LIGHT_RADIUS, LIGHTING_ENGINE
+from spatial import StaticIndex
+
+
+class VisibilityShadow:
+    """
+    Shadow caster which finds the area visible from the light with an angular sweep.
+    Drop in replacement for PAdLib.shadow.Shadow: rather than drawing one polygon per
+    back face, the back faces are sorted by the angles of their ends
+    and swept around the light once, keeping track of which edges each ray
+    crosses, to build a single visibility polygon which is filled once. This costs
+    O(E log E) in the number of nearby edges, plus a scan of the few edges open at
+    each end point.
+    """
+
+    def __init__(self):
+        self.position = [0, 0]
+        self.occluders = []
+        self.set_radius(100.0)
+
+    def set_light_position(self, position):
+        self.position = list(position)
+        self._needs_update = True
+
+    def set_radius(self, radius):
+        self.radius = radius
+        size = rndint(radius) * 2
+        self.mask = pg.Surface((size, size))
+        # The light only reaches as far as its radius
+        self.circle = pg.Surface((size, size))
+        pg.draw.circle(self.circle, (255, 255, 255), (rndint(radius), rndint(radius)), rndint(radius), 0)
+        self._needs_update = True
+
+    def set_occluders(self, occluders):
+        self.occluders = list(occluders)
+        self._needs_update = True
+
+    def _edges(self):
+        """
+        Finds the back faces of the occluders, plus a box around the light
+        so that every ray hits something. Like PAdLib's Shadow, light
+        stops at the far side of an occluder, so occluders themselves are lit.
+        :return: A list of (x1, y1, x2, y2) edges relative to the light.
+        """
+        lx, ly = self.position
+        edges = []
+        for occ in self.occluders:
+            points = occ.points
+            count = len(points)
+            for i in range(count):
+                x1, y1 = points[i][0] - lx, points[i][1] - ly
+                x2, y2 = points[(i + 1) % count][0] - lx, points[(i + 1) % count][1] - ly
+                # Outward normal of a counterclockwise edge is (y1 - y2, x2 - x1)
+                if x1 * (y1 - y2) + y1 * (x2 - x1) > 0:
+                    edges.append((x1, y1, x2, y2))
+        # The box encloses every edge, since the sweep assumes no two edges cross
+        r = max([self.radius] + [abs(value) for edge in edges for value in edge]) + 2
+        edges.extend([(-r, -r, r, -r), (r, -r, r, r), (r, r, -r, r), (-r, r, -r, -r)])
+        return edges
+
+    @staticmethod
+    def _hit(edge, dx, dy):
+        """
+        Finds how far along a ray from the light an edge is.
+        :param edge: The (x1, y1, x2, y2) edge relative to the light.
+        :param dx: The x component of the ray's direction.
+        :param dy: The y component of the ray's direction.
+        :return: The distance along the ray, or None if the ray runs parallel to the edge.
+        """
+        x1, y1, x2, y2 = edge
+        ex, ey = x2 - x1, y2 - y1
+        denominator = dx * ey - dy * ex
+        if denominator == 0:
+            return None
+        return (x1 * ey - y1 * ex) / denominator
+
+    def _nearest(self, open_edges, angle):
+        """
+        Finds where a ray from the light first meets one of the open edges.
+        :param open_edges: The edges the ray crosses.
+        :param angle: The angle of the ray in radians.
+        :return: The (x, y) point hit, relative to the light.
+        """
+        dx, dy = cos(angle), sin(angle)
+        nearest = None
+        for edge in open_edges:
+            distance = self._hit(edge, dx, dy)
+            if distance is not None and distance >= 0 and (nearest is None or distance < nearest):
+                nearest = distance
+        if nearest is None:
+            nearest = self.radius
+        return dx * nearest, dy * nearest
+
+    def _visibility_polygon(self):
+        """
+        Sweeps a ray once around the light, from -pi to pi.
+        :return: The corners of the visible area, relative to the light.
+        """
+        events = []
+        open_edges = set()
+        for edge in self._edges():
+            start = atan2(edge[1], edge[0])
+            end = atan2(edge[3], edge[2])
+            span = end - start
+            if span > pi:
+                span -= 2 * pi
+            elif span <= -pi:
+                span += 2 * pi
+            if span == 0:
+                continue
+            if span < 0:
+                start, end = end, start
+            # The edge already crosses the ray the sweep starts with
+            if start > end:
+                open_edges.add(edge)
+            events.append((start, 1, edge))
+            events.append((end, 0, edge))
+        events.sort(key=lambda event: (event[0], event[1]))
+
+        polygon = []
+        idx = 0
+        while idx < len(events):
+            angle = events[idx][0]
+            before = self._nearest(open_edges, angle)
+            while idx < len(events) and events[idx][0] == angle:
+                _, begins, edge = events[idx]
+                if begins:
+                    open_edges.add(edge)
+                else:
+                    open_edges.discard(edge)
+                idx += 1
+            after = self._nearest(open_edges, angle)
+            polygon.append(before)
+            if after != before:
+                polygon.append(after)
+        return polygon
+
+    def get_mask_and_position(self, fill_occluders):
+        if self._needs_update:
+            self.mask.fill((0, 0, 0))
+            inside = False
+            for occ in self.occluders:
+                if occ.intersects(self.position):
+                    inside = True
+                    break
+            if not inside:
+                r = self.radius
+                polygon = [(rndint(x + r), rndint(y + r)) for x, y in self._visibility_polygon()]
+                if len(polygon) > 2:
+                    pg.draw.polygon(self.mask, (255, 255, 255), polygon, 0)
+                self.mask.blit(self.circle, (0, 0), special_flags=pg.BLEND_MULT)
+                if fill_occluders:
+                    for occ in self.occluders:
+                        pg.draw.polygon(self.mask, (0, 0, 0),
+                                        [[rndint(point[i] - self.position[i] + r) for i in [0, 1]]
+                                         for point in occ.points], 0)
+            self._needs_update = False
+        return self.mask, (rndint(self.position[0] - self.radius), rndint(self.position[1] - self.radius))
+
+
+class Lighting:
+    """
+    Persistent light around the player.
+    Occluders are built once per level in world space, so moving the camera
+    doesn't change them. Each frame only the walls within reach of the light are
+    handed to the shadow caster, and if the light hasn't moved since the last
+    frame the previous mask is reused without redrawing any shadows.
+    """
+
+    def __init__(self, light_mask, radius=LIGHT_RADIUS / 2, engine=LIGHTING_ENGINE):
+        """
+        Creates the lighting for a level without any walls.
+        :param light_mask: The falloff image multiplied into the mask, 2 * radius wide.
+        :param radius: The radius of the light in pixels.
+        :param engine: 'visibility' for VisibilityShadow or 'shadow' for PAdLib's Shadow.
+        """
+        self.light_mask = light_mask
+        self.radius = radius
+        self.shadow = VisibilityShadow() if engine == 'visibility' else shadow.Shadow()
+        # Allocates the shadow mask once instead of every frame
+        self.shadow.set_radius(radius)
+        self.mask = pg.Surface(self.shadow.mask.get_size()).convert()
+        # The mask brightened to at least the night colour, see composite
+        self.lit = pg.Surface(self.shadow.mask.get_size()).convert()
+        self.lit_key = None
+        # Surface of the night colour the size of the mask, blended into lit
+        self.night = pg.Surface(self.shadow.mask.get_size()).convert()
+        self.night_color = None
+        # Surface of the night colour, blended onto everything outside the light
+        self.darkness = None
+        self.darkness_color = None
+        self.index = StaticIndex()
+        self.occluders = {}
+        self.light_pos = None
+        self.nearby = None
+        self.draw_pos = (0, 0)
+
+    def build(self, walls):
+        """
+        Builds an occluder for every wall. Called once per level.
+        :param walls: The walls that block light.
+        :return: None
+        """
+        self.index.build(walls)
+        self.occluders = {}
+        for wall in walls:
+            rect = wall.hit_rect
+            self.occluders[wall] = occluder.Occluder([[rect.x, rect.y],
+                                                      [rect.x, rect.y + rect.height],
+                                                      [rect.x + rect.width, rect.y + rect.height],
+                                                      [rect.x + rect.width, rect.y]])
+        self.light_pos = None
+        self.lit_key = None
+
+    def get_mask_and_position(self, light_pos):
+        """
+        Finds the light mask for a light position, redrawing it only if the light
+        has moved or the walls around it have changed.
+        :param light_pos: The (x, y) world position of the light.
+        :return: The mask and the world position of its top left corner.
+        """
+        light_pos = (light_pos[0], light_pos[1])
+        if light_pos == self.light_pos:
+            return self.mask, self.draw_pos
+        reach = pg.Rect(0, 0, 2 * self.radius, 2 * self.radius)
+        reach.center = light_pos
+        nearby = self.index.query_rect(reach)
+        if nearby != self.nearby:
+            self.shadow.set_occluders([self.occluders[wall] for wall in nearby])
+            self.nearby = nearby
+        self.shadow.set_light_position(light_pos)
+        mask, self.draw_pos = self.shadow.get_mask_and_position(False)
+        self.mask.blit(mask, (0, 0))
+        self.mask.blit(self.light_mask, (0, 0), special_flags=pg.BLEND_MULT)
+        self.light_pos = light_pos
+        return self.mask, self.draw_pos
+
+    def composite(self, surface, light_pos, offset, night_color):
+        """
+        Darkens a surface to night_color everywhere but the light. Only the light's
+        box is blended with the mask, which is brightened to at least night_color
+        once whenever it changes. The rest of the surface is blended with a cached
+        surface of night_color. Gives the same result as filling a full screen fog
+        surface with night_color, blending the mask into it and multiplying it
+        onto the surface.
+        :param surface: The surface to darken, usually the screen.
+        :param light_pos: The (x, y) world position of the light.
+        :param offset: The (x, y) offset from world to surface coordinates.
+        :param night_color: The colour of unlit areas.
+        :return: None
+        """
+        mask, draw_pos = self.get_mask_and_position(light_pos)
+        key = (self.light_pos, tuple(night_color))
+        if key != self.lit_key:
+            if self.night_color != tuple(night_color):
+                self.night.fill(night_color)
+                self.night_color = tuple(night_color)
+            # Blending with a filled surface is much faster than filling with a blend flag
+            self.lit.blit(mask, (0, 0))
+            self.lit.blit(self.night, (0, 0), special_flags=pg.BLEND_MAX)
+            self.lit_key = key
+        if (self.darkness is None or self.darkness.get_size() != surface.get_size() or
+                self.darkness_color != tuple(night_color)):
+            # Blending with a filled surface is much faster than filling with a blend flag
+            self.darkness = pg.Surface(surface.get_size()).convert()
+            self.darkness.fill(night_color)
+            self.darkness_color = tuple(night_color)
+
+        area = self.lit.get_rect(topleft=(draw_pos[0] + offset[0], draw_pos[1] + offset[1]))
+        surface.blit(self.lit, area, special_flags=pg.BLEND_MULT)
+        width, height = surface.get_size()
+        lit_area = area.clip(surface.get_rect())
+        if not lit_area.width or not lit_area.height:
+            surface.blit(self.darkness, (0, 0), special_flags=pg.BLEND_MULT)
+            return
+        for rect in ((0, 0, width, lit_area.top),
+                     (0, lit_area.bottom, width, height - lit_area.bottom),
+                     (0, lit_area.top, lit_area.left, lit_area.height),
+                     (lit_area.right, lit_area.top, width - lit_area.right, lit_area.height)):
+            if rect[2] > 0 and rect[3] > 0:
+                surface.blit(self.darkness, rect[:2], rect, special_flags=pg.BLEND_MULT)
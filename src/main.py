@@ -9,18 +9,28 @@ from settings import WIDTH, HEIGHT, TITLE, TILESIZE, \
     ENEMY_HIT_SOUNDS, PLAYER_FOOTSTEPS, LIGHT_MASK, LIGHT_RADIUS, \
     PLAYER_SWING_NOISES, BG_MUSIC, GAME_OVER_MUSIC, MAIN_MENU_MUSIC, HUD_FONT, TITLE_FONT, \
     BLACK, YELLOW, ORANGE, RIFLE_HUD_IMG, SHOTGUN_HUD_IMG, PISTOL_HUD_IMG, KNIFE_HUD_IMG, \
-    DEEPSKYBLUE, ENEMY_KNOCKBACK, LIMEGREEN, DARKRED, BLOOD_SPLAT, GAME_LEVELS, ITEMS, \
-    PLAYER_MELEE_RECTS
+    DEEPSKYBLUE, ENEMY_KNOCKBACK, LIMEGREEN, DARKRED, BLOOD_SPLAT, ITEMS, \
+    PLAYER_MELEE_RECTS, ENEMY_PATHFINDER, ENEMY_PF_BACKEND, ENEMY_PATH_CACHE_SIZE, \
+    ENEMY_VECTORIZED_STEERING, FOG_COMPOSITING, RENDER_MODE, MAP_CHUNK_SIZE, ASSET_CACHE_FOLDER
 from math import sqrt
 from random import choice, uniform, random, randint
 from player import Player
 from mobs import Mob, SpawnPoint
-from tilemap import Camera, TiledMap
-from sprites import Item, Wall, BulletPassableWall, _Wall, SFX_floor
+from tilemap import Camera, MapChunks
+from sprites import Item, Obstacle, Wall, BulletPassableWall, _Wall, SFX_floor
 from core_functions import collide_hit_rect, world_shift_pos, parse_tuple_to_list
-from pathfinding import Pathfinder, WeightedGraph
-import PAdLib.occluder as occluder
-import PAdLib.shadow as shadow
+from pathfinding import GridPathfinder, JumpPointPathfinder, PathCache, WeightedGraph
+from hierarchical import HierarchicalPathfinder
+from flowfield import FlowField
+from scheduler import PathfindingScheduler, ProcessPoolScheduler
+from spatial import SpatialHash, StaticIndex
+from steering import SteeringEngine, NUMPY_AVAILABLE
+from atlas import RotationAtlas, RotationCache
+from lighting import Lighting
+from levels import LevelManager
+from levelcache import build_wall_layout
+from assets import AssetCache
+from dirty import DirtyRects
 
 if sys.platform in ['win32', 'win64']: os.environ['SDL_VIDEO_CENTERED'] = '1'
 
@@ -79,6 +89,9 @@ class GameEngine:
         Loads the game assets.
         :return: None
         """
+        # Converted and scaled images kept between launches. Hit and miss counts are available through stats()
+        self.assets = AssetCache(path.join(self.game_folder, ASSET_CACHE_FOLDER))
+
         # Dims the pause screen!
         self.pause_screen_effect = pg.Surface(self.screen.get_size()).convert()
         self.pause_screen_effect.fill((0, 0, 0, 225))
@@ -88,27 +101,30 @@ class GameEngine:
         self.fog.fill(self.NIGHT_COLOR)
 
         # Light on the player
-        self.light_mask = pg.image.load(path.join(self.effects_folder, LIGHT_MASK)).convert()
-        self.light_mask = pg.transform.smoothscale(self.light_mask, (LIGHT_RADIUS, LIGHT_RADIUS))
+        self.light_mask = self.assets.load(path.join(self.effects_folder, LIGHT_MASK),
+                                           'convert', ('smoothscale', (LIGHT_RADIUS, LIGHT_RADIUS)))
         self.light_rect = self.light_mask.get_rect()
 
+        # Levels are loaded as they're played
+        self.levels = LevelManager(self.maps_folder)
+
         # On death blood splat
-        self._death_splat = pg.image.load(path.join(self.img_folder, BLOOD_SPLAT)).convert_alpha()
+        self._death_splat = self.assets.load(path.join(self.img_folder, BLOOD_SPLAT))
 
         # Item pickups
         self.pickup_items = {}
         for item in ITEM_IMAGES:
-            self.pickup_items[item] = pg.image.load(path.join(self.item_folder, ITEM_IMAGES[item])).convert_alpha()
+            self.pickup_items[item] = self.assets.load(path.join(self.item_folder, ITEM_IMAGES[item]))
 
         # Fonts
         self.hud_font = path.join(self.font_folder, HUD_FONT)
         self.title_font = path.join(self.font_folder, TITLE_FONT)
 
         # HUD
-        self.hud_images = {'rifle': pg.image.load(path.join(self.hud_folder, RIFLE_HUD_IMG)).convert_alpha(),
-                           'shotgun': pg.image.load(path.join(self.hud_folder, SHOTGUN_HUD_IMG)).convert_alpha(),
-                           'handgun': pg.image.load(path.join(self.hud_folder, PISTOL_HUD_IMG)).convert_alpha(),
-                           'knife': pg.image.load(path.join(self.hud_folder, KNIFE_HUD_IMG)).convert_alpha()
+        self.hud_images = {'rifle': self.assets.load(path.join(self.hud_folder, RIFLE_HUD_IMG)),
+                           'shotgun': self.assets.load(path.join(self.hud_folder, SHOTGUN_HUD_IMG)),
+                           'handgun': self.assets.load(path.join(self.hud_folder, PISTOL_HUD_IMG)),
+                           'knife': self.assets.load(path.join(self.hud_folder, KNIFE_HUD_IMG))
                            }
         font = pg.font.Font(self.hud_font, 20)
         self._hud_hp = font.render('HEALTH', True, WHITE)
@@ -179,21 +195,22 @@ class GameEngine:
 
         # Bullets
         self.bullet_images = {}
-        self.bullet_images['lg'] = pg.transform.smoothscale(pg.image.load(path.join(self.img_folder, RIFLE_BULLET_IMG)),
-                                                            (8, 3)).convert_alpha()
-        self.bullet_images['med'] = pg.transform.smoothscale(
-            pg.image.load(path.join(self.img_folder, HANDGUN_BULLET_IMG)), (5, 3)).convert_alpha()
-        self.bullet_images['sm'] = pg.transform.smoothscale(pg.image.load(
-            path.join(self.img_folder, SHOTGUN_BULLET_IMG)).convert_alpha(), (4, 4))
+        self.bullet_images['lg'] = self.assets.load(path.join(self.img_folder, RIFLE_BULLET_IMG),
+                                                    ('smoothscale', (8, 3)), 'convert_alpha')
+        self.bullet_images['med'] = self.assets.load(path.join(self.img_folder, HANDGUN_BULLET_IMG),
+                                                     ('smoothscale', (5, 3)), 'convert_alpha')
+        self.bullet_images['sm'] = self.assets.load(path.join(self.img_folder, SHOTGUN_BULLET_IMG),
+                                                    'convert_alpha', ('smoothscale', (4, 4)))
 
         # Effects
-        self.gun_flashes = [pg.image.load(path.join(self.effects_folder, flash)).convert_alpha() for flash in
-                            MUZZLE_FLASHES]
+        self.gun_flashes = [self.assets.load(path.join(self.effects_folder, flash)) for flash in MUZZLE_FLASHES]
 
         # Load enemy animations
-        self.enemy_imgs = [pg.transform.smoothscale(pg.image.load(path.join(self.game_folder, name)),
-                                                    (TILESIZE + 16, TILESIZE + 16)).convert_alpha() for name in
-                           ENEMY_IMGS]
+        self.enemy_imgs = [self.assets.load(path.join(self.game_folder, name),
+                                            ('smoothscale', (TILESIZE + 16, TILESIZE + 16)), 'convert_alpha')
+                           for name in ENEMY_IMGS]
+        # Size is available through self.enemy_atlas.stats()
+        self.enemy_atlas = RotationAtlas(self.enemy_imgs)
 
         # Load player animations
         self.default_player_weapon = 'knife'
@@ -201,48 +218,50 @@ class GameEngine:
         self.player_animations = {'handgun': {}, 'knife': {}, 'rifle': {}, 'shotgun': {}, 'feet': {}}
 
         # Create all hand gun animations
-        self.player_animations['handgun']['idle'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['handgun']['idle'] = [self.assets.load(path.join(self.game_folder, name))
                                                      for name in HANDGUN_ANIMATIONS['idle']]
-        self.player_animations['handgun']['melee'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['handgun']['melee'] = [self.assets.load(path.join(self.game_folder, name))
                                                       for name in HANDGUN_ANIMATIONS['melee']]
-        self.player_animations['handgun']['move'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['handgun']['move'] = [self.assets.load(path.join(self.game_folder, name))
                                                      for name in HANDGUN_ANIMATIONS['move']]
-        self.player_animations['handgun']['reload'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['handgun']['reload'] = [self.assets.load(path.join(self.game_folder, name))
                                                        for name in HANDGUN_ANIMATIONS['reload']]
-        self.player_animations['handgun']['shoot'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['handgun']['shoot'] = [self.assets.load(path.join(self.game_folder, name))
                                                       for name in HANDGUN_ANIMATIONS['shoot']]
 
         # Create all knife animations
-        self.player_animations['knife']['idle'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['knife']['idle'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                    name in KNIFE_ANIMATIONS['idle']]
-        self.player_animations['knife']['melee'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['knife']['melee'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                     name in KNIFE_ANIMATIONS['melee']]
-        self.player_animations['knife']['move'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['knife']['move'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                    name in KNIFE_ANIMATIONS['move']]
 
         # Create all rifle animations
-        self.player_animations['rifle']['idle'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['rifle']['idle'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                    name in RIFLE_ANIMATIONS['idle']]
-        self.player_animations['rifle']['melee'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['rifle']['melee'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                     name in RIFLE_ANIMATIONS['melee']]
-        self.player_animations['rifle']['move'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['rifle']['move'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                    name in RIFLE_ANIMATIONS['move']]
-        self.player_animations['rifle']['reload'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['rifle']['reload'] = [self.assets.load(path.join(self.game_folder, name))
                                                      for name in RIFLE_ANIMATIONS['reload']]
-        self.player_animations['rifle']['shoot'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha() for
+        self.player_animations['rifle']['shoot'] = [self.assets.load(path.join(self.game_folder, name)) for
                                                     name in RIFLE_ANIMATIONS['shoot']]
 
         # Create all shotgun animations
-        self.player_animations['shotgun']['idle'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['shotgun']['idle'] = [self.assets.load(path.join(self.game_folder, name))
                                                      for name in SHOTGUN_ANIMATIONS['idle']]
-        self.player_animations['shotgun']['melee'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['shotgun']['melee'] = [self.assets.load(path.join(self.game_folder, name))
                                                       for name in SHOTGUN_ANIMATIONS['melee']]
-        self.player_animations['shotgun']['move'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['shotgun']['move'] = [self.assets.load(path.join(self.game_folder, name))
                                                      for name in SHOTGUN_ANIMATIONS['move']]
-        self.player_animations['shotgun']['reload'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['shotgun']['reload'] = [self.assets.load(path.join(self.game_folder, name))
                                                        for name in SHOTGUN_ANIMATIONS['reload']]
-        self.player_animations['shotgun']['shoot'] = [pg.image.load(path.join(self.game_folder, name)).convert_alpha()
+        self.player_animations['shotgun']['shoot'] = [self.assets.load(path.join(self.game_folder, name))
                                                       for name in SHOTGUN_ANIMATIONS['shoot']]
+        # Rotated player frames, filled as they are drawn. Hit rate is available through stats()
+        self.player_frames = RotationCache()
 
     def _load_map_data(self):
         """
@@ -284,11 +303,12 @@ class GameEngine:
         Creates a new game
         :return: None
         """
-        self.maps = [TiledMap(path.join(self.maps_folder, _map)) for _map in GAME_LEVELS]
         self.map_idx = 0
-        self.map = self.maps[self.map_idx]
-        self.map_img = self.map.make_map().copy().convert()
-        self.map_rect = self.map_img.get_rect()
+        # Parsed levels are kept between games, so restarting doesn't load them again
+        self.map = self.levels.get(self.map_idx)
+        # Rendered a chunk at a time as the camera reaches it
+        self.map_chunks = MapChunks(self.map)
+        self.map_rect = self.map_chunks.rect
         self.all_sprites = pg.sprite.LayeredUpdates()
         self.lighting_obstacles = []
         self.walls = pg.sprite.Group()  # Obstacles that are impassable
@@ -302,21 +322,51 @@ class GameEngine:
         self.swingAreas = pg.sprite.Group()
         self.SFX_floors = pg.sprite.Group()
         self.spawn_points = []  # spawn points for mob spawning
+        self.mob_hash = SpatialHash()  # Mobs bucketed by position, rebuilt every frame
+        # Steers every mob at once, or None to steer each mob in Mob.update
+        self.steering = SteeringEngine() if ENEMY_VECTORIZED_STEERING and NUMPY_AVAILABLE else None
+        self.wall_index = StaticIndex()  # Every wall, built once per level for collisions
+        self.bullet_index = StaticIndex()  # Walls bullets can't pass, built once per level
+        # The mob's obstacle avoidance walls, built once per level. Queried with a large
+        # radius, so coarser cells mean fewer buckets to visit.
+        self.avoidance_index = StaticIndex(4 * TILESIZE)
+        self.lighting = Lighting(self.light_mask)  # Walls are added once per level
         self.camera = Camera(self.map.width, self.map.height)
+        self.dirty_rects = DirtyRects(self.screen.get_rect())  # Parts of the screen to redraw
         self.paused = False
         self.running = True
-        self.pathfinder = Pathfinder()
+        # Hit and miss counts are available through self.path_cache.stats()
+        self.path_cache = PathCache(ENEMY_PATH_CACHE_SIZE)
+        if ENEMY_PATHFINDER == 'jump point':
+            self.pathfinder = JumpPointPathfinder(self.path_cache)
+        elif ENEMY_PATHFINDER == 'hierarchical':
+            self.pathfinder = HierarchicalPathfinder(self.path_cache)
+        else:
+            self.pathfinder = GridPathfinder(self.path_cache)
         self.game_graph = WeightedGraph(self.map.tmxdata.width, self.map.tmxdata.height)
-        self.game_graph.walls = []
+        self.flow_field = None
+        if ENEMY_PATHFINDER == 'flow field':
+            self.flow_field = FlowField(self.game_graph)
         self._load_map_data()
         self.get_wall_positions()
+        # Builds the pathfinder's tables, and for HPA* its abstract graph, before play starts
+        self.pathfinder.prepare(self.game_graph)
+        if ENEMY_PF_BACKEND == 'process pool':
+            self.pathfinding_scheduler = ProcessPoolScheduler(self.game_graph, self.player, ENEMY_PATHFINDER,
+                                                              cache=self.path_cache)
+        else:
+            self.pathfinding_scheduler = PathfindingScheduler(self.pathfinder, self.game_graph)
         # The player's score
         self.player_score = 0
         # How long the player has been alive for
         self.player_alive_time = pg.time.get_ticks()
         # The current time in the world
         self.current_time = pg.time.get_ticks()
-        self.run()
+        try:
+            self.run()
+        finally:
+            # Also reached when the window is closed, which exits through _quit
+            self.pathfinding_scheduler.close()
 
     def run(self):
         """
@@ -349,6 +399,10 @@ class GameEngine:
                 spawn_point.update()
             spawn_point.spawn_mob()
 
+        # Used for the neighbours of every mob, by the SteeringEngine or by Mob.update
+        self.mob_hash.rebuild(self.mobs)
+        if self.steering is not None:
+            self.steering.update(self.mobs, self.player, self.dt, self.mob_hash)
         for sprite in self.all_sprites:
             if sprite == self.player:
                 sprite.update(pg.key.get_pressed())
@@ -356,7 +410,12 @@ class GameEngine:
                 sprite.update()
 
         self.camera.update(self.player)
+        self.map_chunks.prefetch(self.camera.visible_rect(MAP_CHUNK_SIZE // 2))
         self.swingAreas.update()
+        # Only recomputed when the player steps onto a new tile, and only
+        # while some mob has lost sight of the player and may steer by it
+        if self.flow_field is not None and any(mob.can_find_path for mob in self.mobs):
+            self.flow_field.update((self.player.pos.x // TILESIZE, self.player.pos.y // TILESIZE))
         self.update_pathfinding_queue()
 
         for sfx_floor in self.SFX_floors:
@@ -365,7 +424,10 @@ class GameEngine:
 
         # Bullet hits obstacle
         if self.bullets:
-            pg.sprite.groupcollide(self.bullets, self.walls, True, False, collide_hit_rect)
+            for bullet in self.bullets.sprites():
+                # Bullets pass over bullet passable walls
+                if self.bullet_index.query_rect(bullet.hit_rect):
+                    bullet.kill()
 
         # bullet hits mob
         if self.bullets: # there are bullets in the air...
@@ -466,45 +528,94 @@ class GameEngine:
         renders the updated game state onto the screen
         :return: None
         """
-        self.screen.blit(self.map_img, self.camera.apply_rect(self.map_rect))
-        for sprite in self.all_sprites:
-            if isinstance(sprite, Mob) and sprite.is_onscreen:
-                self.screen.blit(sprite.image, self.camera.apply(sprite))
+        offset = self.camera.camera.topleft
+        full = RENDER_MODE != 'dirty rects' or self.paused or self.on_control_screen
+        self.dirty_rects.begin(offset, full)
+        drawn = self._cull_sprites()
+        for sprite, rect, area in drawn:
+            if isinstance(sprite, Mob):
+                self.dirty_rects.add(sprite, area, (sprite.image, sprite.health))
             else:
-                self.screen.blit(sprite.image, self.camera.apply(sprite))
+                self.dirty_rects.add(sprite, area, sprite.image)
+        mask, draw_pos = self.lighting.get_mask_and_position(self.player.hit_rect.center)
+        self.dirty_rects.add('light', mask.get_rect(topleft=self.camera.apply_to_point(draw_pos)),
+                             (self.lighting.light_pos, tuple(self.NIGHT_COLOR)))
+        # The crosshair is redrawn every frame, since its colour depends on the mobs under it
+        x, y = pg.mouse.get_pos()
+        radius = WEAPONS[self.player.weapon]['crosshair radius'] + 2
+        crosshair = pg.Rect(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1)
+        self.dirty_rects.add('crosshair', crosshair)
+        self.dirty_rects.add_area(crosshair)
+
+        rects = self.dirty_rects.rects()
+        if rects is None:
+            self._render_world(drawn)
+            if self.paused:
+                self.screen.blit(self.pause_screen_effect, (0, 0))
+                self._render_text('Paused', self.title_font, 105, RED, WIDTH / 2, HEIGHT / 2, align='center')
+            if self.on_control_screen:
+                self.control_screen()
+            pg.display.flip()
+            return
+        # The camera hasn't moved, so only the parts of the screen that changed are redrawn
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self._render_world(drawn, rect)
+        self.screen.set_clip(None)
+        pg.display.update(rects)
+
+    def _cull_sprites(self):
+        """
+        Builds the list of sprites to draw this frame, leaving out those that
+        are entirely off the screen. Keeps the drawing order of all_sprites.
+        :return: A list of (sprite, screen rect, screen area covered) to draw.
+        """
+        screen_rect = self.screen.get_rect()
+        offset = self.camera.camera.topleft
+        drawn = []
+        for sprite in self.all_sprites:
+            rect = sprite.rect.move(offset)
+            # Images are drawn from the rect's corner and can be larger than the rect
+            area = pg.Rect(rect.topleft, sprite.image.get_size())
+            if isinstance(sprite, Mob):
+                # Includes the health bar, which can stick out past the image
+                area.union_ip(pg.Rect(rect.x + sprite.hit_rect.width // 3, rect.y, sprite.hit_rect.width, 7))
+            if area.colliderect(screen_rect):
+                drawn.append((sprite, rect, area))
+        return drawn
+
+    def _render_world(self, drawn, area=None):
+        """
+        Draws the map, the sprites, the fog and the HUD.
+        :param drawn: A list of (sprite, screen rect, screen area covered) to draw.
+        :param area: The screen rect to redraw, or None for the whole screen.
+        :return: None
+        """
+        self.map_chunks.draw(self.screen, self.camera.camera.topleft, area)
+        for sprite, rect, covered in drawn:
+            if area is not None and not area.colliderect(covered):
+                continue
+            self.screen.blit(sprite.image, rect)
+            if isinstance(sprite, Mob):
+                sprite.render_health(self.screen, rect)
         self._render_fog()
         self._render_hud()
-        if self.paused:
-            self.screen.blit(self.pause_screen_effect, (0, 0))
-            self._render_text('Paused', self.title_font, 105, RED, WIDTH / 2, HEIGHT / 2, align='center')
-        if self.on_control_screen:
-            self.control_screen()
-        pg.display.flip()
 
     def _render_fog(self):
         """
         Creates the in-game lighting effect.
         :return:
         """
-        shad = shadow.Shadow()
-        occluders = []
-        for wall in self.walls:
-            rect = self.camera.apply_rect(wall.hit_rect, True)
-            occluders.append(occluder.Occluder([[rect.x, rect.y],
-                                                [rect.x, rect.y + rect.height],
-                                                [rect.x + rect.width, rect.y + rect.height],
-                                                [rect.x + rect.width, rect.y]]))
-
-        shad.set_occluders(occluders)
-        shad.set_radius(275.0)
-        shad.set_light_position(self.camera.apply_rect(self.player.hit_rect.copy()).center)
-        mask, draw_pos = shad.get_mask_and_position(False)
-
-        mask.blit(self.light_mask, (0, 0), special_flags=pg.BLEND_MULT)
+        if FOG_COMPOSITING == 'light area':
+            self.lighting.composite(self.screen, self.player.hit_rect.center, self.camera.camera.topleft,
+                                    self.NIGHT_COLOR)
+            return
+        # Only redrawn when the player has moved
+        mask, draw_pos = self.lighting.get_mask_and_position(self.player.hit_rect.center)
 
         self.fog.fill(self.NIGHT_COLOR)
 
-        self.fog.blit(mask, draw_pos, special_flags=pg.BLEND_MAX)
+        self.fog.blit(mask, self.camera.apply_to_point(draw_pos), special_flags=pg.BLEND_MAX)
 
         self.screen.blit(self.fog, (0, 0), special_flags=pg.BLEND_MULT)
 
@@ -625,17 +736,27 @@ class GameEngine:
                                              vec(predator.pos.x // TILESIZE, predator.pos.y // TILESIZE),
                                              vec(prey.pos.x // TILESIZE, prey.pos.y // TILESIZE))
 
+    def request_path(self, predator, prey):
+        """
+        Queues a request for a path for the predator to reach its prey.
+        The path is handed back to the predator once it has been found.
+        :param predator: The entity who seeks
+        :param prey: The unknowning target
+        :return: None
+        """
+        self.pathfinding_scheduler.submit(predator,
+                                          (predator.pos.x // TILESIZE, predator.pos.y // TILESIZE),
+                                          (prey.pos.x // TILESIZE, prey.pos.y // TILESIZE))
+
     def update_pathfinding_queue(self):
         """
-        Gives each mob on the level the opportunity to find a path
-        to its prey (the player). Each mob will be given this
-        opportunity in order according to their list position into
-        the mobs group.
+        Works through the mobs' queued path requests for at most
+        ENEMY_PF_FRAME_BUDGET milliseconds. Requests are served in the
+        order they were made and any search left unfinished carries on
+        next frame.
         :return: None
         """
-        # for mob in self.mobs:
-        #     if not mob.path:
-        #         mob.track_prey(self.player)
+        self.pathfinding_scheduler.update()
 
     def get_wall_positions(self):
         """
@@ -643,24 +764,27 @@ class GameEngine:
         :return:
         """
         all_obstacles = [wall for wall in self.walls] + [wall for wall in self.bullet_passable_walls]
-        for wall in all_obstacles:
-            if wall.rect.width > TILESIZE and wall.rect.height > TILESIZE:
-                for x in range(wall.rect.x, wall.rect.x + wall.rect.width, TILESIZE):
-                    for y in range(wall.rect.y, wall.rect.y + wall.rect.height, TILESIZE):
-                        self.game_graph.walls.append((x // TILESIZE, y // TILESIZE))
-            elif wall.rect.width > TILESIZE and wall.rect.height == TILESIZE:
-                for x in range(wall.rect.x, wall.rect.x + wall.rect.width, TILESIZE):
-                    self.game_graph.walls.append((x // TILESIZE, wall.rect.y // TILESIZE))
-            elif wall.rect.height > TILESIZE and wall.rect.width == TILESIZE:
-                for y in range(wall.rect.y, wall.rect.y + wall.rect.height, TILESIZE):
-                    self.game_graph.walls.append((wall.rect.x // TILESIZE, y // TILESIZE))
-            else:
-                self.game_graph.walls.append((wall.rect.x // TILESIZE, wall.rect.y // TILESIZE))
+        # Read from the level cache if there is one, otherwise worked out from the walls
+        layout = self.map.wall_layout
+        if layout is None:
+            layout = build_wall_layout(self.game_graph.width, self.game_graph.height,
+                                       [wall.rect for wall in self.walls],
+                                       [wall.rect for wall in self.bullet_passable_walls])
+        grid, tiles, colliders, bullet_colliders = layout
+        self.game_graph.set_grid(grid)
         self.all_walls.empty()
         for obs in all_obstacles:
             self.all_walls.add(obs)
-        for position in self.game_graph.walls:
-            _Wall(self, position[0] * TILESIZE, position[1] * TILESIZE)
+        # Adjacent walls are merged into larger rectangles so collisions,
+        # avoidance and lighting have fewer and larger pieces to check
+        for rect in tiles:
+            _Wall(self, *rect)
+        colliders = [Obstacle(self, *rect) for rect in colliders]
+        bullet_colliders = [Obstacle(self, *rect) for rect in bullet_colliders]
+        self.wall_index.build(colliders)
+        self.bullet_index.build(bullet_colliders)
+        self.avoidance_index.build(self._walls)
+        self.lighting.build(bullet_colliders)
 
     def start_screen(self):
         """
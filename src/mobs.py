@@ -1,10 +1,10 @@
 import pygame as pg
-from random import choice, uniform, random
+from random import choice, uniform, random, randrange
 from core_functions import collide_with_obstacles
 from settings import MOB_LAYER, ENEMY_HIT_RECT, ENEMY_SPEEDS, ENEMY_HEALTH, ENEMY_DAMAGE, WANDER_RING_RADIUS, \
     SEEK_FORCE, WIDTH, HEIGHT, TILESIZE, DETECT_RADIUS, GREEN, RED, YELLOW, vec, WANDER_RING_DISTANCE, \
     ENEMY_LINE_OF_SIGHT, AVOID_RADIUS, APPROACH_RADIUS, ENEMY_ATTACK_RATE, WIDTH, ENEMY_LOOT_DROP_CHANCE, \
-    ENEMY_WEAPON_DROP_CHANCE, ENEMY_MOAN_CHANCE
+    ENEMY_WEAPON_DROP_CHANCE, ENEMY_MOAN_CHANCE, ENEMY_PF_QUEUE_UPDATE_RATE
 from sprites import Item
 from math import sqrt
 
@@ -28,12 +28,11 @@ class Mob(pg.sprite.Sprite):
         self.game = game
         pg.sprite.Sprite.__init__(self, self.groups)
 
-        # Image copies are necessary. The reason being is that
-        # if were not for the copy, any damage pasted onto the enemy
-        # image would have been replicated onto the other enemies
-        # even if they haven't been damaged
-        self.original_image = choice(game.enemy_imgs).copy()
-        self.image = self.original_image.copy()
+        # Images are shared by every mob and never drawn on.
+        # Damage is drawn over the mob by render_health at render time.
+        self.image_idx = randrange(len(game.enemy_imgs))
+        self.original_image = game.enemy_imgs[self.image_idx]
+        self.image = self.original_image
         self.rect = self.image.get_rect()
         self.rect.center = vec(x, y)
 
@@ -69,6 +68,9 @@ class Mob(pg.sprite.Sprite):
         self.path = None
         self.current_path_target = 0
         self.can_find_path = False
+        self.last_path_request = -ENEMY_PF_QUEUE_UPDATE_RATE
+        # Shared flow field the mob steers by instead of following its own path
+        self.flow_field = None
 
     def track_prey(self, target):
         """
@@ -76,10 +78,26 @@ class Mob(pg.sprite.Sprite):
         :param target: The mob's prey.
         :return:
         """
-        if self.can_find_path and not self.path:
-            self.path = self.game.find_path(self, target)
-            if self.path:
-                self.current_path_target = len(self.path) - 2
+        if self.can_find_path and not self.path and not self.flow_field:
+            if self.game.flow_field is not None and self.game.flow_field.reaches(self.pos):
+                self.flow_field = self.game.flow_field
+                return
+            # The path is solved over the next few frames and handed back through set_path
+            now = pg.time.get_ticks()
+            if now - self.last_path_request > ENEMY_PF_QUEUE_UPDATE_RATE:
+                self.last_path_request = now
+                self.game.request_path(self, target)
+
+    def set_path(self, path):
+        """
+        Gives the mob a path to follow
+        :param path: A list of Vector2 objects from the end of the path back to its start,
+                or None if no path was found.
+        :return: None
+        """
+        self.path = path
+        if self.path:
+            self.current_path_target = len(self.path) - 2
 
     def pause(self):
         """
@@ -242,10 +260,9 @@ class Mob(pg.sprite.Sprite):
         :param pos: The mob's position
         :return: True if there is a potential collision False otherwise
         """
-        obs_center = vec(obs.rect.center)
-        d1 = obs_center.distance_to(ahead)
-        d2 = obs_center.distance_to(further_ahead)
-        d3 = obs_center.distance_to(pos)
+        d1 = obs.nearest_point(ahead).distance_to(ahead)
+        d2 = obs.nearest_point(further_ahead).distance_to(further_ahead)
+        d3 = obs.nearest_point(pos).distance_to(pos)
         return (d1 <= obs.radius) or (d2 <= obs.radius) or (d3 <= obs.radius)
 
     def find_most_threatening_obstacle(self, ahead, further_ahead, pos, obstacles):
@@ -260,9 +277,11 @@ class Mob(pg.sprite.Sprite):
         most_threatening = None
         for wall in obstacles:
             collide = self.find_collision(wall, ahead, further_ahead, pos)
-            if collide and (not most_threatening or self.pos.distance_to(wall.rect.center) <
-                self.pos.distance_to(most_threatening)):
-                most_threatening = wall.pos
+            if collide:
+                # Walls may span several tiles, so the threat is the part of the wall nearest the mob
+                nearest = wall.nearest_point(self.pos)
+                if not most_threatening or self.pos.distance_to(nearest) < self.pos.distance_to(most_threatening):
+                    most_threatening = nearest
         return most_threatening
 
     def obstacle_avoidance(self, obstacles):
@@ -320,11 +339,8 @@ class Mob(pg.sprite.Sprite):
         Used to check if this mob is on the screen or not
         :return: True if on the screen, False otherwise
         """
-        location = vec(self.game.camera.apply_rect(self.hit_rect.copy()).topleft)
-        if location.x <= WIDTH + 3 * TILESIZE and location.y <= HEIGHT + 3 * TILESIZE:
-            self.is_onscreen = True
-        else:
-            self.is_onscreen = False
+        # Within a few tiles of any edge of the screen
+        self.is_onscreen = self.game.camera.visible_rect(3 * TILESIZE).colliderect(self.hit_rect)
 
     def drop_item(self):
         """
@@ -355,6 +371,12 @@ class Mob(pg.sprite.Sprite):
         Path following algorithm.
         :return:
         """
+        if self.flow_field:
+            target = self.flow_field.next_waypoint(self.pos)
+            if target is None:
+                self.flow_field = None
+                return vec(0, 0)
+            return self.seek(target)
         if self.current_path_target >= 0:
             target = self.path[self.current_path_target]
             if self.pos.distance_to(target) <= DETECT_RADIUS:
@@ -365,59 +387,112 @@ class Mob(pg.sprite.Sprite):
             self.path = None
             return vec(0, 0)
 
-    def update(self):
+    def choose_behaviour(self):
         """
-        Update this mob's internal state
-        :return: None
+        Decides how this mob moves this frame.
+        A mob pursues the player once it is close enough, otherwise it
+        follows its path if it has one and wanders if it doesn't. Once a mob
+        has seen the player, it tracks them with a path after losing sight of them.
+        :return: 'pursue', 'follow' or 'wander'
         """
-        self.check_if_is_on_screen()
-        nearby_enemies = [mob for mob in self.game.mobs if self.pos.distance_to(mob.pos) < DETECT_RADIUS / 2]
-        nearby_obstacles = [obs for obs in self.game._walls if self.pos.distance_to(obs.pos) < DETECT_RADIUS / 2]
-        if self.health <= 0:
-            self.drop_item()
-            self.kill()
-            self.game.map_img.blit(self.game._death_splat, self.hit_rect.topleft)
-        self.track_prey(self.game.player)
         if self.pos.distance_to(self.game.player.pos) < DETECT_RADIUS:
+            self.can_find_path = True
             if random() < ENEMY_MOAN_CHANCE:
                 snd = choice(self.game.zombie_moan_sounds)
                 if snd.get_num_channels() > 2:
                     snd.stop()
                 snd.play()
-            self.apply_pursuing_behaviour(nearby_enemies, nearby_obstacles)
-            self.rot = (self.target - self.pos).angle_to(vec(1, 0))
             self.path = None
-        elif self.path:
+            self.flow_field = None
+            return 'pursue'
+        elif self.path or self.flow_field:
+            return 'follow'
+        return 'wander'
+
+    def plan(self):
+        """
+        Applies the steering forces which depend on this mob alone. Used by the
+        SteeringEngine, which adds the pursuit and flocking forces of every mob
+        and moves them all at once afterwards.
+        :return: The behaviour chosen by choose_behaviour
+        """
+        nearby_obstacles = self.game.avoidance_index.query_radius(self.pos, DETECT_RADIUS / 2)
+        behaviour = self.choose_behaviour()
+        if behaviour == 'pursue':
+            prey = self.game.player
+            self.target = prey.pos if prey.vel.length() == 0 else prey.pos + prey.vel.normalize()
+            self.acc += self.obstacle_avoidance(nearby_obstacles) * 2.6
+            self.rot = (self.target - self.pos).angle_to(vec(1, 0))
+        elif behaviour == 'follow':
             self.target = self.follow_path()
             self.acc += self.target
-            self.apply_flocking_behaviour(nearby_enemies, nearby_obstacles)
+            self.acc += self.obstacle_avoidance(nearby_obstacles) * 2.5
             self.rot = (self.target - self.pos).angle_to(vec(1, 0))
         else:
-            self.apply_wandering_behaviour(nearby_enemies, nearby_obstacles)
+            self.acc += self.wander()
+            self.acc += self.obstacle_avoidance(nearby_obstacles) * 1.75
             self.rot = self.vel.angle_to(vec(1, 0))
-        self.vel += self.acc * self.game.dt
-        self.vel.scale_to_length(self.speed)
+        return behaviour
+
+    def update(self):
+        """
+        Update this mob's internal state
+        :return: None
+        """
+        self.check_if_is_on_screen()
+        if self.health <= 0:
+            self.drop_item()
+            self.kill()
+            self.game.map_chunks.stamp(self.game._death_splat, self.hit_rect.topleft)
+            self.game.dirty_rects.invalidate(self.game._death_splat.get_rect(topleft=self.hit_rect.topleft))
+        self.track_prey(self.game.player)
+        # Otherwise the SteeringEngine has already steered and moved this mob
+        if self.game.steering is None:
+            nearby_enemies = self.game.mob_hash.query_radius(self.pos, DETECT_RADIUS / 2)
+            nearby_obstacles = self.game.avoidance_index.query_radius(self.pos, DETECT_RADIUS / 2)
+            behaviour = self.choose_behaviour()
+            if behaviour == 'pursue':
+                self.apply_pursuing_behaviour(nearby_enemies, nearby_obstacles)
+                self.rot = (self.target - self.pos).angle_to(vec(1, 0))
+            elif behaviour == 'follow':
+                self.target = self.follow_path()
+                self.acc += self.target
+                self.apply_flocking_behaviour(nearby_enemies, nearby_obstacles)
+                self.rot = (self.target - self.pos).angle_to(vec(1, 0))
+            else:
+                self.apply_wandering_behaviour(nearby_enemies, nearby_obstacles)
+                self.rot = self.vel.angle_to(vec(1, 0))
+            self.vel += self.acc * self.game.dt
+            self.vel.scale_to_length(self.speed)
+            if self.can_attack:
+                self.pos += self.vel * self.game.dt + 0.5 * self.acc * self.game.dt ** 2
         if self.can_attack:
-            self.pos += self.vel * self.game.dt + 0.5 * self.acc * self.game.dt ** 2
             self.hit_rect.centerx = self.pos.x
-            collide_with_obstacles(self, self.game.all_walls, 'x')
+            collide_with_obstacles(self, self.game.wall_index, 'x')
             self.hit_rect.centery = self.pos.y
-            collide_with_obstacles(self, self.game.all_walls, 'y')
+            collide_with_obstacles(self, self.game.wall_index, 'y')
         if self.is_onscreen:
-            self.image = pg.transform.rotozoom(self.original_image, self.rot - 90, 1).copy()
+            # Nearest of the frames rotated at load time
+            self.image = self.game.enemy_atlas.get(self.image_idx, self.rot - 90)
         self.rect.center = self.hit_rect.center
         now = pg.time.get_ticks()
         if now - self.last_attack_time > ENEMY_ATTACK_RATE:
             self.can_attack = True
             self.last_attack_time = now
 
-    def render_health(self):
+    def render_health(self, surface, rect):
         """
-        Each mob will have their health bars superimposed
-        onto their sprite images so as to give the player
-        visual indication that they've damaged this sprite
+        Each mob will have their health bars drawn over
+        their sprite images so as to give the player
+        visual indication that they've damaged this sprite.
+        Drawn at render time since the images are shared.
+        :param surface: The surface the mob was drawn on
+        :param rect: Where the mob was drawn on the surface
         :return: None
         """
+        # Undamaged mobs have no health bar
+        if self.health >= self.MAX_HEALTH:
+            return
         if self.health > .6 * self.MAX_HEALTH:
             color = GREEN
         elif self.health > .3 * self.MAX_HEALTH:
@@ -425,9 +500,8 @@ class Mob(pg.sprite.Sprite):
         else:
             color = RED
         width = int(self.hit_rect.width * self.health / self.MAX_HEALTH)
-        self.health_bar = pg.Rect(self.hit_rect.width // 3, 0, width, 7)
-        if self.health < self.MAX_HEALTH:
-            pg.draw.rect(self.image, color, self.health_bar)
+        self.health_bar = pg.Rect(rect.x + self.hit_rect.width // 3, rect.y, width, 7)
+        pg.draw.rect(surface, color, self.health_bar)
 
 
 # Location for a mob to spawn
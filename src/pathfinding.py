@@ -1,4 +1,5 @@
 import heap
+from collections import OrderedDict
 from settings import GRIDWIDTH, GRIDHEIGHT, TILESIZE, vec
 
 
@@ -8,6 +9,8 @@ class Graph(object):
     The layout of the game is given by a two dimensional array of "tiles", where each tile is a
     64 x 64 rectangle located by its index in the the array. Each tile in the array is a node in the graph
     and there are edges between nodes iff two nodes are both passable and contained in the graph.
+    Walls are stored in a packed occupancy grid so that checking a node costs a single index
+    regardless of how many walls are on the level.
     """
 
     def __init__(self, width, height):
@@ -18,10 +21,115 @@ class Graph(object):
         #self.width = GRIDWIDTH
         self.width = width
         self.height = height
-        self.walls = []
+        # Packed occupancy grid. Each tile is one byte indexed by y * width + x,
+        # where a non zero byte marks the tile as a wall.
+        self.grid = bytearray(width * height)
+        # Bumped on every change to the grid so that anything derived
+        # from it knows when it has gone stale.
+        self.version = 0
         self.connections = [vec(1, 0), vec(-1, 0), vec(0, 1), vec(0, -1)]
         self.connections += [vec(1, 1), vec(-1, 1), vec(1, -1), vec(-1, -1)]
 
+    @property
+    def walls(self):
+        """
+        The tile positions of every wall in the graph.
+        :return: A list of (x, y) tuples.
+        """
+        return [(idx % self.width, idx // self.width) for idx, wall in enumerate(self.grid) if wall]
+
+    @walls.setter
+    def walls(self, positions):
+        """
+        Replaces every wall in the graph with the given tile positions.
+        :param positions: An iterable of (x, y) tile positions.
+        :return: None
+        """
+        self.grid = bytearray(self.width * self.height)
+        self.version += 1
+        for position in positions:
+            self.add_wall(position)
+
+    def set_grid(self, grid):
+        """
+        Replaces the whole occupancy grid, such as with one read from a level cache.
+        :param grid: width * height bytes, non zero for walls, indexed as in the grid.
+        :return: None
+        """
+        self.grid = bytearray(grid)
+        self.version += 1
+
+    def index(self, node):
+        """
+        Packs a node's coordinates into its index in the occupancy grid.
+        :param node: The node under consideration.
+        :return: Integer index of the node.
+        """
+        return int(node[1]) * self.width + int(node[0])
+
+    def add_wall(self, node):
+        """
+        Marks a single tile as impassable.
+        :param node: The tile position of the wall.
+        :return: None
+        """
+        if self.in_bounds(node):
+            self.grid[self.index(node)] = 1
+            self.version += 1
+
+    def remove_wall(self, node):
+        """
+        Marks a single tile as passable.
+        :param node: The tile position of the wall.
+        :return: None
+        """
+        if self.in_bounds(node):
+            self.grid[self.index(node)] = 0
+            self.version += 1
+
+    def _fill_rect(self, x, y, width, height, value):
+        """
+        Sets every tile within a rectangle of tiles to the given value.
+        The rectangle is clipped to the bounds of the graph.
+        :param x: The left most tile column.
+        :param y: The top most tile row.
+        :param width: The number of tile columns.
+        :param height: The number of tile rows.
+        :param value: 1 for walls, 0 for passable tiles.
+        :return: None
+        """
+        left, right = max(0, x), min(self.width, x + width)
+        top, bottom = max(0, y), min(self.height, y + height)
+        if left >= right:
+            return
+        row = bytes([value]) * (right - left)
+        for _y in range(top, bottom):
+            start = _y * self.width + left
+            self.grid[start:start + len(row)] = row
+        self.version += 1
+
+    def mark_rect(self, x, y, width, height):
+        """
+        Marks a rectangle of tiles as impassable.
+        :param x: The left most tile column.
+        :param y: The top most tile row.
+        :param width: The number of tile columns.
+        :param height: The number of tile rows.
+        :return: None
+        """
+        self._fill_rect(x, y, width, height, 1)
+
+    def clear_rect(self, x, y, width, height):
+        """
+        Marks a rectangle of tiles as passable.
+        :param x: The left most tile column.
+        :param y: The top most tile row.
+        :param width: The number of tile columns.
+        :param height: The number of tile rows.
+        :return: None
+        """
+        self._fill_rect(x, y, width, height, 0)
+
     def in_bounds(self, node):
         """
         Determines whether or not a given node is contained in the graph by checking to see
@@ -29,16 +137,16 @@ class Graph(object):
         :param node: The node under consideration
         :return: True if the graph contains, False otherwise.
         """
-        return 0 <= node.x < self.width and 0 <= node.y < self.height
+        return 0 <= node[0] < self.width and 0 <= node[1] < self.height
 
     def passable(self, node):
         """
         Determines if a node is passable or not. Passable here means that
         there does not exist an obstacle at position the node represents.
         :param node: The node under consideration.
-        :return: True if the node is not passable, False otherwise.
+        :return: True if the node is passable, False otherwise.
         """
-        return node not in self.walls
+        return not self.grid[self.index(node)]
 
     def find_neighbors(self, node):
         """
@@ -68,6 +176,22 @@ class WeightedGraph(Graph):
         super(WeightedGraph, self).__init__(width, height)
         self.weights = {}
 
+    def set_weight(self, node, weight):
+        """
+        Sets the extra cost of travelling onto a node.
+        Weights should be changed through here rather than through
+        the weights dictionary so that the graph's version is bumped.
+        :param node: The (x, y) tile position of the node.
+        :param weight: The extra cost. A weight of 0 removes it.
+        :return: None
+        """
+        node = (int(node[0]), int(node[1]))
+        if weight:
+            self.weights[node] = weight
+        else:
+            self.weights.pop(node, None)
+        self.version += 1
+
     def cost(self, start, end):
         """
         Calculates the cost of the edge between two nodes.
@@ -89,11 +213,17 @@ class PriorityQueue:
     Uses a heap for efficiency.
     """
 
-    def __init__(self):
+    def __init__(self, update_existing=False):
         """
         Creates an empty priority queue
+        :param update_existing: If True, putting a node that is already queued
+                lowers its cost in place instead of queueing a stale copy.
         """
-        self.nodes = []
+        self.update_existing = update_existing
+        if update_existing:
+            self.nodes = heap.IndexedMinHeap()
+        else:
+            self.nodes = []
 
     def put(self, node, cost):
         """
@@ -102,13 +232,18 @@ class PriorityQueue:
         :param cost: The cost to travel to that node.
         :return: None
         """
-        heap.min_heap_push(self.nodes, node, cost)
+        if self.update_existing:
+            self.nodes.push(node, cost)
+        else:
+            heap.min_heap_push(self.nodes, node, cost)
 
     def get(self):
         """
         Retrieves the node with the least cost to travel to.
         :return: Tuple containing the coordinates to travel to.
         """
+        if self.update_existing:
+            return self.nodes.pop()[1]
         return heap.min_heap_pop(self.nodes)[1]
 
     def empty(self):
@@ -128,7 +263,7 @@ class Pathfinder:
         """
         Creates a new pathfinder.
         """
-        self.frontier = PriorityQueue()
+        self.frontier = PriorityQueue(update_existing=True)
         self.path = {}
         self.cost = {}
 
@@ -176,7 +311,7 @@ class Pathfinder:
                 path.append(vec(current.x * TILESIZE, current.y * TILESIZE))
             return path
 
-        self.frontier = PriorityQueue()
+        self.frontier = PriorityQueue(update_existing=True)
         self.frontier.put(vector_to_tuple(start), 0)
         self.path = {}
         self.cost = {}
@@ -200,3 +335,449 @@ class Pathfinder:
         if vector_to_tuple(end) in self.path:
             return construct_path(self.path, end, start)
         return None
+
+
+class PathCache:
+    """
+    Least recently used cache of paths keyed by (start tile, goal tile).
+    A request that misses can still be served from any cached path to the same goal
+    that passes through the requested start tile, by cutting off the part of that
+    path before the start. The whole cache is thrown away whenever the walls or
+    weights of the graph change.
+    """
+
+    def __init__(self, size):
+        """
+        Creates an empty path cache.
+        :param size: The most paths the cache holds.
+        """
+        self.size = size
+        self.version = None
+        # (start, goal) -> list of (x, y) tiles from goal back to start
+        self.paths = OrderedDict()
+        # goal -> set of (start, goal) keys of the cached paths that end there
+        self.goals = {}
+        self.hits = 0
+        self.subpath_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.paths)
+
+    def clear(self):
+        """
+        Removes every cached path.
+        :return: None
+        """
+        self.paths.clear()
+        self.goals.clear()
+
+    def validate(self, graph):
+        """
+        Empties the cache if the graph has changed since paths were cached.
+        :param graph: The graph under consideration.
+        :return: None
+        """
+        if graph.version != self.version:
+            self.clear()
+            self.version = graph.version
+
+    @staticmethod
+    def _to_world(path):
+        return [vec(x * TILESIZE, y * TILESIZE) for x, y in path]
+
+    def _store(self, key, path):
+        """
+        Adds a path of tiles to the cache, evicting the least recently used path if it is full.
+        :param key: The (start, goal) key.
+        :param path: The list of (x, y) tiles from goal back to start.
+        :return: None
+        """
+        if key in self.paths:
+            self.paths.move_to_end(key)
+        elif len(self.paths) >= self.size:
+            old_key, _ = self.paths.popitem(last=False)
+            keys = self.goals[old_key[1]]
+            keys.discard(old_key)
+            if not keys:
+                del self.goals[old_key[1]]
+        self.paths[key] = path
+        self.goals.setdefault(key[1], set()).add(key)
+
+    def get(self, graph, start, goal):
+        """
+        Looks up a path from start to goal.
+        :param graph: The graph the path is on.
+        :param start: The (x, y) starting tile.
+        :param goal: The (x, y) ending tile.
+        :return: A list of Vector2 objects from goal back to start, or None on a miss.
+        """
+        self.validate(graph)
+        key = ((int(start[0]), int(start[1])), (int(goal[0]), int(goal[1])))
+        path = self.paths.get(key)
+        if path is not None:
+            self.paths.move_to_end(key)
+            self.hits += 1
+            return self._to_world(path)
+        for other in self.goals.get(key[1], ()):
+            other_path = self.paths[other]
+            try:
+                idx = other_path.index(key[0])
+            except ValueError:
+                continue
+            path = other_path[:idx + 1]
+            self._store(key, path)
+            self.subpath_hits += 1
+            return self._to_world(path)
+        self.misses += 1
+        return None
+
+    def put(self, graph, start, goal, path):
+        """
+        Caches a path from start to goal.
+        :param graph: The graph the path is on.
+        :param start: The (x, y) starting tile.
+        :param goal: The (x, y) ending tile.
+        :param path: A list of Vector2 objects from goal back to start.
+        :return: None
+        """
+        self.validate(graph)
+        key = ((int(start[0]), int(start[1])), (int(goal[0]), int(goal[1])))
+        self._store(key, [(int(node.x) // TILESIZE, int(node.y) // TILESIZE) for node in path])
+
+    def stats(self):
+        """
+        Reports how well the cache is doing so that its size can be tuned.
+        :return: Dictionary of the hit, subpath hit and miss counts, the hit rate and the number of cached paths.
+        """
+        lookups = self.hits + self.subpath_hits + self.misses
+        return {'hits': self.hits,
+                'subpath hits': self.subpath_hits,
+                'misses': self.misses,
+                'hit rate': (self.hits + self.subpath_hits) / lookups if lookups else 0.0,
+                'size': len(self.paths)}
+
+
+class GridPathfinder:
+    """
+    A* search over packed integer node ids.
+    The graph's occupancy grid is copied into a padded grid with a one tile wall border,
+    so a node id is y * (width + 2) + x and its neighbours are found by adding
+    precomputed offsets without any bounds checks. Nothing in the search loop
+    allocates Vector2 objects; the path is converted to world space once it is found.
+    """
+
+    def __init__(self, cache=None):
+        """
+        Creates a new grid pathfinder.
+        :param cache: Optional PathCache consulted before searching.
+        """
+        self.cache = cache
+        self.graph = None
+        self.version = None
+        self.width = 0
+        self.blocked = bytearray()
+        self.weights = []
+        self.weighted = False
+        # (offset, base cost) for each of the 8 connections
+        self.steps = []
+
+    def prepare(self, graph):
+        """
+        Builds the padded grid, neighbour offsets and edge cost table for a graph.
+        Only does any work if the graph has changed since it was last prepared.
+        :param graph: The graph under consideration.
+        :return: None
+        """
+        if graph is self.graph and graph.version == self.version:
+            return
+        width = graph.width + 2
+        self.width = width
+        self.blocked = bytearray(b'\x01') * (width * (graph.height + 2))
+        for y in range(graph.height):
+            row = graph.grid[y * graph.width:(y + 1) * graph.width]
+            start = (y + 1) * width + 1
+            self.blocked[start:start + graph.width] = row
+        self.weights = [0] * len(self.blocked)
+        self.weighted = False
+        for (x, y), weight in getattr(graph, 'weights', {}).items():
+            if weight and graph.in_bounds((x, y)):
+                self.weights[(y + 1) * width + x + 1] = weight
+                self.weighted = True
+        self.steps = [(1, 10), (-1, 10), (width, 10), (-width, 10),
+                      (width + 1, 14), (width - 1, 14), (-width + 1, 14), (-width - 1, 14)]
+        self.graph = graph
+        self.version = graph.version
+
+    def node_id(self, node):
+        """
+        Packs a tile position into a node id in the padded grid.
+        :param node: The (x, y) tile position.
+        :return: Integer node id, or None if the position is outside the graph.
+        """
+        x, y = int(node[0]), int(node[1])
+        if not self.graph.in_bounds((x, y)):
+            return None
+        return (y + 1) * self.width + x + 1
+
+    def to_world(self, node_id):
+        """
+        Converts a node id into the world position of its tile.
+        :param node_id: The node under consideration.
+        :return: Vector2 of the tile's top left corner.
+        """
+        y, x = divmod(node_id, self.width)
+        return vec((x - 1) * TILESIZE, (y - 1) * TILESIZE)
+
+    def heuristic(self, a, b):
+        """
+        Octile distance heuristic, which matches the 10/14 edge costs.
+        :param a: Initial node id
+        :param b: Final node id
+        :return: Integer estimate of the cost from a to b
+        """
+        ay, ax = divmod(a, self.width)
+        by, bx = divmod(b, self.width)
+        dx = abs(ax - bx)
+        dy = abs(ay - by)
+        if dx > dy:
+            return 10 * dx + 4 * dy
+        return 10 * dy + 4 * dx
+
+    def construct_path(self, came_from, start, goal):
+        """
+        Walks back from goal to start and converts each node into world space.
+        :param came_from: The dictionary of traversed nodes.
+        :param start: The initial node id.
+        :param goal: The final node id.
+        :return: A list of Vector2 objects from goal back to start.
+        """
+        current = goal
+        path = [self.to_world(current)]
+        while current != start:
+            current = came_from[current]
+            path.append(self.to_world(current))
+        return path
+
+    def successors(self, current, parent, goal):
+        """
+        Finds the nodes reachable from a node along with the cost of reaching them.
+        :param current: The node being expanded.
+        :param parent: The node current was reached from, or None at the start.
+        :param goal: The goal node id.
+        :return: A list of (node id, edge cost) pairs.
+        """
+        blocked = self.blocked
+        weights = self.weights
+        return [(current + offset, step_cost + weights[current + offset])
+                for offset, step_cost in self.steps if not blocked[current + offset]]
+
+    def iter_search(self, start, goal, expansions=None):
+        """
+        Resumable A* between two node ids on the prepared graph.
+        This is a generator which yields after every `expansions` nodes are expanded,
+        so a search can be spread over several frames. Once the search is over, the
+        generator returns the came_from dictionary if goal was reached and None otherwise.
+        :param start: The starting node id.
+        :param goal: The ending node id.
+        :param expansions: How many nodes to expand between yields. None never yields.
+        :return: A generator.
+        """
+        heuristic = self.heuristic
+        successors = self.successors
+        frontier = heap.IndexedMinHeap()
+        frontier.push(start, 0)
+        came_from = {start: start}
+        cost = {start: 0}
+        expanded = 0
+        while frontier:
+            current = frontier.pop()[1]
+            if current == goal:
+                return came_from
+            current_cost = cost[current]
+            parent = came_from[current] if current != start else None
+            for next, edge_cost in successors(current, parent, goal):
+                next_cost = current_cost + edge_cost
+                if next_cost < cost.get(next, next_cost + 1):
+                    cost[next] = next_cost
+                    came_from[next] = current
+                    frontier.push(next, next_cost + heuristic(next, goal))
+            expanded += 1
+            if expansions and expanded % expansions == 0:
+                yield
+        return None
+
+    def search(self, start, goal):
+        """
+        Runs A* between two node ids on the prepared graph to completion.
+        :param start: The starting node id.
+        :param goal: The ending node id.
+        :return: The came_from dictionary if goal was reached, None otherwise.
+        """
+        steps = self.iter_search(start, goal)
+        try:
+            while True:
+                next(steps)
+        except StopIteration as done:
+            return done.value
+
+    def a_star_search(self, graph, start, end):
+        """
+        A* search implementation. Drop in replacement for Pathfinder.a_star_search.
+        :param graph: The graph under consideration.
+        :param start: The starting node in the graph
+        :param end: The ending node in the graph.
+        :return: A list of Vector2 objects indicating the path
+                from end back to start, or None if there isn't one.
+        """
+        if self.cache is not None:
+            path = self.cache.get(graph, start, end)
+            if path is not None:
+                return path
+        self.prepare(graph)
+        start_id = self.node_id(start)
+        goal_id = self.node_id(end)
+        if start_id is None or goal_id is None or self.blocked[goal_id]:
+            return None
+        came_from = self.search(start_id, goal_id)
+        if came_from is None:
+            return None
+        path = self.construct_path(came_from, start_id, goal_id)
+        if self.cache is not None:
+            self.cache.put(graph, start, end, path)
+        return path
+
+
+class JumpPointPathfinder(GridPathfinder):
+    """
+    Jump Point Search over the padded grid.
+    On a uniform cost grid most nodes lie on straight or diagonal runs that A* would
+    expand one at a time. JPS skips along those runs and only stops at nodes with
+    forced neighbours, so far fewer nodes ever reach the frontier. Since this relies
+    on every step of a run costing the same, graphs that carry weights are handed
+    to plain A* instead.
+    """
+
+    def _jump_straight(self, node, offset, side, goal):
+        """
+        Jumps along a horizontal or vertical run.
+        :param node: The node the jump starts from.
+        :param offset: The node id offset of one step along the run.
+        :param side: The node id offset perpendicular to the run.
+        :param goal: The goal node id.
+        :return: The next jump point, or None if the run hits a wall.
+        """
+        blocked = self.blocked
+        while True:
+            node += offset
+            if blocked[node]:
+                return None
+            if node == goal:
+                return node
+            if (blocked[node + side] and not blocked[node + side + offset]) or \
+                    (blocked[node - side] and not blocked[node - side + offset]):
+                return node
+
+    def _jump(self, node, dx, dy, goal):
+        """
+        Jumps from a node in the given direction.
+        :param node: The node the jump starts from.
+        :param dx: The horizontal direction (-1, 0 or 1).
+        :param dy: The vertical direction (-1, 0 or 1).
+        :param goal: The goal node id.
+        :return: The next jump point, or None if there isn't one.
+        """
+        width = self.width
+        if dy == 0:
+            return self._jump_straight(node, dx, width, goal)
+        if dx == 0:
+            return self._jump_straight(node, dy * width, 1, goal)
+        blocked = self.blocked
+        vertical = dy * width
+        while True:
+            node += dx + vertical
+            if blocked[node]:
+                return None
+            if node == goal:
+                return node
+            if (blocked[node - dx] and not blocked[node - dx + vertical]) or \
+                    (blocked[node - vertical] and not blocked[node - vertical + dx]):
+                return node
+            if self._jump_straight(node, dx, width, goal) is not None or \
+                    self._jump_straight(node, vertical, 1, goal) is not None:
+                return node
+
+    def _directions(self, node, parent):
+        """
+        Prunes the directions worth jumping in from a node.
+        :param node: The node being expanded.
+        :param parent: The jump point the node was reached from, or None at the start.
+        :return: A list of (dx, dy) directions.
+        """
+        if parent is None:
+            return [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+        width = self.width
+        blocked = self.blocked
+        ny, nx = divmod(node, width)
+        py, px = divmod(parent, width)
+        dx = (nx > px) - (nx < px)
+        dy = (ny > py) - (ny < py)
+        if dx and dy:
+            directions = [(dx, 0), (0, dy), (dx, dy)]
+            if blocked[node - dx]:
+                directions.append((-dx, dy))
+            if blocked[node - dy * width]:
+                directions.append((dx, -dy))
+        elif dx:
+            directions = [(dx, 0)]
+            if blocked[node + width]:
+                directions.append((dx, 1))
+            if blocked[node - width]:
+                directions.append((dx, -1))
+        else:
+            directions = [(0, dy)]
+            if blocked[node + 1]:
+                directions.append((1, dy))
+            if blocked[node - 1]:
+                directions.append((-1, dy))
+        return directions
+
+    def successors(self, current, parent, goal):
+        """
+        Finds the jump points reachable from a node along with the cost of reaching them.
+        Falls back to the plain grid neighbours if the graph carries any weights.
+        :param current: The node being expanded.
+        :param parent: The jump point current was reached from, or None at the start.
+        :param goal: The goal node id.
+        :return: A list of (node id, edge cost) pairs.
+        """
+        if self.weighted:
+            return super(JumpPointPathfinder, self).successors(current, parent, goal)
+        jump_points = []
+        for dx, dy in self._directions(current, parent):
+            next = self._jump(current, dx, dy, goal)
+            if next is not None:
+                jump_points.append((next, self.heuristic(current, next)))
+        return jump_points
+
+    def construct_path(self, came_from, start, goal):
+        """
+        Walks back from goal to start, filling in every tile between
+        consecutive jump points so the path has one waypoint per tile.
+        :param came_from: The dictionary of traversed jump points.
+        :param start: The initial node id.
+        :param goal: The final node id.
+        :return: A list of Vector2 objects from goal back to start.
+        """
+        width = self.width
+        current = goal
+        path = [self.to_world(current)]
+        while current != start:
+            parent = came_from[current]
+            cy, cx = divmod(current, width)
+            py, px = divmod(parent, width)
+            step = ((px > cx) - (px < cx)) + ((py > cy) - (py < cy)) * width
+            while current != parent:
+                current += step
+                path.append(self.to_world(current))
+        return path
@@ -389,8 +389,8 @@ class Player(pg.sprite.Sprite):
             if now - self.last_update > WEAPONS['animation times'][self.weapon][self.action]:
                 self.last_update = now
                 self.current_frame = (self.current_frame + 1) % len(self.animations)
-            self.image = pg.transform.rotozoom(self.animations[self.current_frame], self.rot, 1)
-            self.rect = self.image.get_rect()
+            self.image, self.rect = self.game.player_frames.get((self.weapon, self.action, self.current_frame),
+                                                                self.animations[self.current_frame], self.rot)
         else:
             self.animations = self.game.player_animations[self.weapon][self.canned_action]
             if now - self.last_update > WEAPONS['animation times'][self.weapon][self.canned_action]:
@@ -400,8 +400,9 @@ class Player(pg.sprite.Sprite):
                 # until all of the frames for that specific action
                 # have been used up.
                 try:
-                    self.image = pg.transform.rotozoom(self.animations[self.current_frame], self.rot, 1)
-                    self.rect = self.image.get_rect()
+                    self.image, self.rect = self.game.player_frames.get(
+                        (self.weapon, self.canned_action, self.current_frame),
+                        self.animations[self.current_frame], self.rot)
                 except IndexError:
                     self.play_static_animation = False
                     self.canned_action = ''
@@ -516,7 +517,7 @@ class Player(pg.sprite.Sprite):
         self.rect.center = self.pos
         self.pos += self.vel * self.game.dt
         self.hit_rect.centerx = self.pos.x
-        collide_with_obstacles(self, self.game.all_walls, 'x')
+        collide_with_obstacles(self, self.game.wall_index, 'x')
         self.hit_rect.centery = self.pos.y
-        collide_with_obstacles(self, self.game.all_walls, 'y')
+        collide_with_obstacles(self, self.game.wall_index, 'y')
         self.rect.center = self.hit_rect.center
@@ -0,0 +1,309 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from time import perf_counter
+from hierarchical import HierarchicalPathfinder
+from pathfinding import GridPathfinder, JumpPointPathfinder, WeightedGraph
+from settings import ENEMY_PATHFINDER, ENEMY_PF_FRAME_BUDGET, ENEMY_PF_SLICE_SIZE, ENEMY_PF_WORKERS, TILESIZE, vec
+
+
+class PathRequest:
+    """
+    A mob's request for a path that may take several frames to solve.
+    """
+
+    def __init__(self, mob, start, goal):
+        """
+        Creates a new path request.
+        :param mob: The mob the path is for.
+        :param start: The (x, y) tile the mob is on.
+        :param goal: The (x, y) tile the mob wants to reach.
+        """
+        self.mob = mob
+        self.start = start
+        self.goal = goal
+        self.search = None
+        self.start_id = None
+        self.goal_id = None
+        self.version = None
+
+
+class PathfindingScheduler:
+    """
+    Spreads the pathfinding requests of every mob over as many frames as needed.
+    Searches are paused after a fixed number of expansions and resumed on a later
+    frame, and no more than a fixed number of milliseconds are spent on them each
+    frame, so the worst case frame time no longer depends on how many mobs need
+    routes at once.
+    """
+
+    def __init__(self, pathfinder, graph, budget=ENEMY_PF_FRAME_BUDGET, slice_size=ENEMY_PF_SLICE_SIZE):
+        """
+        Creates a new scheduler.
+        :param pathfinder: The GridPathfinder used to solve requests.
+        :param graph: The graph paths are found on.
+        :param budget: Milliseconds that may be spent on searches each frame.
+        :param slice_size: Nodes expanded between checks of the budget.
+        """
+        self.pathfinder = pathfinder
+        self.graph = graph
+        self.budget = budget
+        self.slice_size = slice_size
+        self.requests = OrderedDict()
+
+    def __len__(self):
+        return len(self.requests)
+
+    def submit(self, mob, start, goal):
+        """
+        Queues a path request. A mob has at most one request queued;
+        submitting again replaces its goal and restarts its search.
+        :param mob: The mob the path is for.
+        :param start: The (x, y) tile the mob is on.
+        :param goal: The (x, y) tile the mob wants to reach.
+        :return: None
+        """
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+        request = self.requests.get(mob)
+        if request and request.start == start and request.goal == goal:
+            return
+        self.requests[mob] = PathRequest(mob, start, goal)
+
+    def cancel(self, mob):
+        """
+        Drops any request queued for a mob.
+        :param mob: The mob under consideration.
+        :return: None
+        """
+        self.requests.pop(mob, None)
+
+    def close(self):
+        """
+        Drops every queued request.
+        :return: None
+        """
+        self.requests.clear()
+
+    def _cached(self, request):
+        """
+        Looks a request up in the pathfinder's path cache.
+        :param request: The request under consideration.
+        :return: The cached path, or None if there isn't one.
+        """
+        if self.pathfinder.cache is None:
+            return None
+        return self.pathfinder.cache.get(self.graph, request.start, request.goal)
+
+    def _begin(self, request):
+        """
+        Starts the search for a request.
+        :param request: The request under consideration.
+        :return: False if the request can never be solved, True otherwise.
+        """
+        pathfinder = self.pathfinder
+        pathfinder.prepare(self.graph)
+        request.start_id = pathfinder.node_id(request.start)
+        request.goal_id = pathfinder.node_id(request.goal)
+        request.version = self.graph.version
+        if request.start_id is None or request.goal_id is None or pathfinder.blocked[request.goal_id]:
+            return False
+        request.search = pathfinder.iter_search(request.start_id, request.goal_id, self.slice_size)
+        return True
+
+    def update(self):
+        """
+        Works through the queued requests, oldest first, until they are all
+        solved or this frame's budget has been used. Solved paths are handed
+        to their mobs through Mob.set_path.
+        :return: None
+        """
+        deadline = perf_counter() + self.budget / 1000
+        while self.requests and perf_counter() < deadline:
+            mob, request = next(iter(self.requests.items()))
+            if not mob.alive():
+                del self.requests[mob]
+                continue
+            # The map changed under a search in progress
+            if request.search is not None and request.version != self.graph.version:
+                request.search = None
+            if request.search is None:
+                path = self._cached(request)
+                if path is not None:
+                    del self.requests[mob]
+                    mob.set_path(path)
+                    continue
+                if not self._begin(request):
+                    del self.requests[mob]
+                    mob.set_path(None)
+                    continue
+            try:
+                next(request.search)
+            except StopIteration as done:
+                del self.requests[mob]
+                if done.value is None:
+                    mob.set_path(None)
+                else:
+                    path = self.pathfinder.construct_path(done.value, request.start_id, request.goal_id)
+                    if self.pathfinder.cache is not None:
+                        self.pathfinder.cache.put(self.graph, request.start, request.goal, path)
+                    mob.set_path(path)
+
+
+# State of a worker process in the process pool
+_worker_memory = None
+_worker_graph = None
+_worker_pathfinder = None
+
+
+def _init_worker(memory_name, width, height, pathfinder):
+    """
+    Attaches a worker process to the shared copy of the wall grid.
+    :param memory_name: The name of the shared memory block.
+    :param width: The width of the graph in tiles.
+    :param height: The height of the graph in tiles.
+    :param pathfinder: The pathfinder to solve with, as for ENEMY_PATHFINDER.
+    :return: None
+    """
+    global _worker_memory, _worker_graph, _worker_pathfinder
+    _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    _worker_graph = WeightedGraph(width, height)
+    _worker_graph.grid = _worker_memory.buf[:width * height]
+    if pathfinder == 'jump point':
+        _worker_pathfinder = JumpPointPathfinder()
+    elif pathfinder == 'hierarchical':
+        _worker_pathfinder = HierarchicalPathfinder()
+    else:
+        # Flow fields are built in the game process, so A* stands in for them
+        _worker_pathfinder = GridPathfinder()
+
+
+def _solve(start, goal, version, weights):
+    """
+    Solves a path request inside a worker process.
+    :param start: The (x, y) tile to start from.
+    :param goal: The (x, y) tile to reach.
+    :param version: The version of the graph the request was made against.
+    :param weights: The graph's weights.
+    :return: A list of (x, y) tiles from goal back to start, or None if there is no path.
+    """
+    _worker_graph.version = version
+    _worker_graph.weights = weights
+    # Rebuilds the padded grid, and for HPA* the abstract graph, once per version of the map
+    _worker_pathfinder.prepare(_worker_graph)
+    path = _worker_pathfinder.a_star_search(_worker_graph, start, goal)
+    if path is None:
+        return None
+    return [(int(node.x) // TILESIZE, int(node.y) // TILESIZE) for node in path]
+
+
+class ProcessPoolScheduler:
+    """
+    Solves the mobs' path requests in a pool of worker processes.
+    The wall grid is copied into a block of shared memory which the workers
+    read from, so searches run on other cores instead of competing with the game
+    loop for the GIL. Results arrive asynchronously and are dropped if the target
+    has since moved to another tile or the map has changed.
+    Has the same interface as PathfindingScheduler.
+    """
+
+    def __init__(self, graph, target, pathfinder=ENEMY_PATHFINDER, workers=ENEMY_PF_WORKERS, cache=None):
+        """
+        Starts the worker processes.
+        :param graph: The graph paths are found on.
+        :param target: The sprite paths lead to. Results are stale once it changes tile.
+        :param pathfinder: The pathfinder the workers solve with, as for ENEMY_PATHFINDER.
+        :param workers: The number of worker processes.
+        :param cache: Optional PathCache consulted before sending a request to the workers.
+        """
+        self.graph = graph
+        self.target = target
+        self.cache = cache
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, len(graph.grid)))
+        self.version = None
+        self._sync()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(self.memory.name, graph.width, graph.height, pathfinder))
+        # mob -> (future, start, goal, version)
+        self.requests = {}
+
+    def __len__(self):
+        return len(self.requests)
+
+    def _sync(self):
+        """
+        Copies the wall grid into shared memory if it has changed.
+        :return: None
+        """
+        if self.version != self.graph.version:
+            self.memory.buf[:len(self.graph.grid)] = self.graph.grid
+            self.version = self.graph.version
+
+    def _target_tile(self):
+        return int(self.target.pos.x // TILESIZE), int(self.target.pos.y // TILESIZE)
+
+    def submit(self, mob, start, goal):
+        """
+        Sends a path request to the worker processes. A mob has at most one
+        request in flight; any earlier one is forgotten.
+        :param mob: The mob the path is for.
+        :param start: The (x, y) tile the mob is on.
+        :param goal: The (x, y) tile the mob wants to reach.
+        :return: None
+        """
+        self._sync()
+        start = (int(start[0]), int(start[1]))
+        goal = (int(goal[0]), int(goal[1]))
+        self.cancel(mob)
+        if self.cache is not None:
+            path = self.cache.get(self.graph, start, goal)
+            if path is not None:
+                mob.set_path(path)
+                return
+        future = self.executor.submit(_solve, start, goal, self.version, dict(getattr(self.graph, 'weights', {})))
+        self.requests[mob] = (future, start, goal, self.version)
+
+    def cancel(self, mob):
+        """
+        Forgets any request in flight for a mob.
+        :param mob: The mob under consideration.
+        :return: None
+        """
+        request = self.requests.pop(mob, None)
+        if request:
+            request[0].cancel()
+
+    def update(self):
+        """
+        Hands every finished path back to its mob through Mob.set_path,
+        dropping results that have gone stale.
+        :return: None
+        """
+        self._sync()
+        target_tile = self._target_tile()
+        for mob, (future, start, goal, version) in list(self.requests.items()):
+            if not future.done():
+                continue
+            del self.requests[mob]
+            if not mob.alive() or future.cancelled() or future.exception() is not None:
+                continue
+            if goal != target_tile or version != self.graph.version:
+                continue
+            path = future.result()
+            if path is None:
+                mob.set_path(None)
+            else:
+                path = [vec(x * TILESIZE, y * TILESIZE) for x, y in path]
+                if self.cache is not None:
+                    self.cache.put(self.graph, start, goal, path)
+                mob.set_path(path)
+
+    def close(self):
+        """
+        Stops the worker processes and frees the shared memory.
+        :return: None
+        """
+        self.requests.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.memory.close()
+        self.memory.unlink()
@@ -7,6 +7,9 @@ vec = pg.math.Vector2
 GAME_LEVELS = [
     'GroundLevel.tmx',  # 'Apartments1.tmx',
 ]
+LEVEL_CACHE = True  # Read levels from the binary .lvl cache next to their TMX files, rebuilt when stale
+ASSET_CACHE = True  # Keep converted and scaled images on disk so later launches skip decoding them
+ASSET_CACHE_FOLDER = '../data/cache'  # Where the cached images are kept, relative to the source folder
 
 # Define some colors (R, G, B)
 WHITE = (255, 255, 255)
@@ -37,6 +40,8 @@ BGCOLOR = DARKGREY
 TILESIZE = 64
 GRIDWIDTH = 32
 GRIDHEIGHT = 24
+MAP_CHUNK_SIZE = 512  # Width and height in pixels of the chunks the map is rendered in
+MAP_CHUNK_MEMORY = 16 * 1024 * 1024  # Most bytes the rendered map chunks may take
 
 # Fonts
 HUD_FONT = 'kenpixel_high_square.ttf'
@@ -77,6 +82,10 @@ FLASH_DURATION = 70
 LASER_SIGHT_COLORS = [(124, 252, 0), (50, 205, 50), (173, 255, 47), (152, 251, 152), (34, 139, 34)]
 LIGHT_MASK = 'light_falloff100.png'
 LIGHT_RADIUS = 550
+FOG_COMPOSITING = 'light area'  # 'light area' (only blends the light's box) or 'full screen'
+RENDER_MODE = 'dirty rects'  # 'dirty rects' (redraws what changed while the camera is still) or 'full'
+DIRTY_RECT_LIMIT = 0.5  # Fraction of the screen past which a dirty rect frame is redrawn in full
+LIGHTING_ENGINE = 'visibility'  # 'visibility' (single polygon sweep) or 'shadow' (PAdLib, one polygon per face)
 BLOOD_SHADES = [(value, 0, 0) for value in range(255, 8, -8)]
 BLOOD_SPLAT = 'Blood/splat red.png'
 BG_MUSIC = 'Infested City.ogg'
@@ -92,6 +101,8 @@ SPRINT_BOOST = 2.25
 DEFAULT_WEAPON = 'knife'
 PLAYER_SPEED = 140
 PLAYER_HIT_RECT = pg.Rect(0, 0, 50, 50)
+PLAYER_ROTATION_STEP = 1  # Degrees the player's rotation is rounded to when drawing
+PLAYER_ROTATION_CACHE_SIZE = 1024  # Most rotated player frames kept
 PLAYER_MELEE_RECTS = {
     'knife': pg.Rect(0, 0, 50, 50),
     'handgun': pg.Rect(0, 0, 50, 50),
@@ -151,12 +162,22 @@ PLAYER_FOOTSTEP_INTERVAL_TIMES = {
 ENEMY_MOAN_CHANCE = 0.007
 ENEMY_LOOT_DROP_CHANCE = .05
 ENEMY_WEAPON_DROP_CHANCE = .25
-ENEMY_PF_QUEUE_UPDATE_RATE = 1000
+ENEMY_PF_QUEUE_UPDATE_RATE = 1000  # Least time in ms between a mob's path requests
+ENEMY_PF_FRAME_BUDGET = 2  # Time in ms that path searches may take each frame
+ENEMY_PF_SLICE_SIZE = 50  # Nodes a path search expands before checking the frame budget
+ENEMY_PF_BACKEND = 'frame budget'  # 'frame budget' or 'process pool'
+ENEMY_PF_WORKERS = 2  # Worker processes used by the 'process pool' backend
+ENEMY_PATH_CACHE_SIZE = 256  # Most paths kept in the path cache
+HPA_CLUSTER_SIZE = 10  # Width and height in tiles of the clusters used by the 'hierarchical' pathfinder
+ENEMY_PATHFINDER = 'jump point'  # 'a star', 'jump point', 'hierarchical' or 'flow field'
+ENEMY_VECTORIZED_STEERING = True  # Steer every mob at once with NumPy, if it is installed
 ENEMY_ATTACK_RATE = 500
 ENEMY_DAMAGE = [x for x in range(20, 40)]
 ENEMY_KNOCKBACK = 10
 ENEMY_LINE_OF_SIGHT = TILESIZE / 2.25
 ENEMY_HIT_RECT = pg.Rect(0, 0, TILESIZE, TILESIZE)
+ENEMY_ROTATION_STEP = 5  # Degrees between the pre-rotated frames of each enemy image
+ENEMY_ROTATION_MEMORY = 64 * 1024 * 1024  # Most bytes the pre-rotated enemy frames may take
 ENEMY_SPEEDS = [speed for speed in range(150, 220, 10)]
 ENEMY_HEALTH = 500
 DETECT_RADIUS = 550
@@ -0,0 +1,151 @@
+from settings import TILESIZE
+
+
+class SpatialHash:
+    """
+    Uniform grid of buckets for finding the sprites near a point.
+    Each sprite is filed under the cell containing its position, so a radius query
+    only has to look at the sprites in the handful of cells the radius covers
+    instead of every sprite on the level.
+    """
+
+    def __init__(self, cell_size=TILESIZE):
+        """
+        Creates an empty spatial hash.
+        :param cell_size: The width and height of a cell in pixels.
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def __len__(self):
+        return sum(len(cell) for cell in self.cells.values())
+
+    def _cell(self, pos):
+        return int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+
+    def clear(self):
+        """
+        Removes every sprite from the hash.
+        :return: None
+        """
+        self.cells = {}
+
+    def insert(self, sprite):
+        """
+        Files a sprite under the cell containing its position.
+        :param sprite: A sprite with a pos attribute.
+        :return: None
+        """
+        cell = self._cell(sprite.pos)
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            self.cells[cell] = [sprite]
+        else:
+            bucket.append(sprite)
+
+    def rebuild(self, sprites):
+        """
+        Refiles every sprite from scratch. Called once per frame for sprites that move.
+        :param sprites: An iterable of sprites with pos attributes.
+        :return: None
+        """
+        self.cells = {}
+        for sprite in sprites:
+            self.insert(sprite)
+
+    def query_radius(self, pos, radius):
+        """
+        Finds the sprites within a radius of a point.
+        :param pos: Vector2 of the point.
+        :param radius: The radius in pixels.
+        :return: A list of sprites whose positions are closer than radius to pos.
+        """
+        left, top = self._cell((pos[0] - radius, pos[1] - radius))
+        right, bottom = self._cell((pos[0] + radius, pos[1] + radius))
+        cells = self.cells
+        nearby = []
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                bucket = cells.get((x, y))
+                if bucket:
+                    nearby.extend(sprite for sprite in bucket if pos.distance_to(sprite.pos) < radius)
+        return nearby
+
+
+class StaticIndex:
+    """
+    Grid of buckets for sprites that never move, such as walls.
+    Built once per level; each sprite is filed under every cell its hit_rect
+    overlaps, so rect and radius queries only look at the sprites near the
+    query instead of every sprite on the level. Results come back in the
+    order the sprites were given to build, matching pg.sprite.spritecollide.
+    """
+
+    def __init__(self, cell_size=TILESIZE):
+        """
+        Creates an empty static index.
+        :param cell_size: The width and height of a cell in pixels.
+        """
+        self.cell_size = cell_size
+        self.sprites = []
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def build(self, sprites):
+        """
+        Files every sprite from scratch. Called once per level.
+        :param sprites: An iterable of sprites with hit_rect and pos attributes.
+        :return: None
+        """
+        self.sprites = list(sprites)
+        self.cells = {}
+        size = self.cell_size
+        for idx, sprite in enumerate(self.sprites):
+            rect = sprite.hit_rect
+            for x in range(int(rect.left // size), int((rect.right - 1) // size) + 1):
+                for y in range(int(rect.top // size), int((rect.bottom - 1) // size) + 1):
+                    self.cells.setdefault((x, y), []).append(idx)
+
+    def _candidates(self, left, top, right, bottom):
+        """
+        Gathers the sprites filed under the cells covering an area.
+        :return: A list of sprites in build order, each appearing once.
+        """
+        size = self.cell_size
+        cells = self.cells
+        found = set()
+        for x in range(int(left // size), int(right // size) + 1):
+            for y in range(int(top // size), int(bottom // size) + 1):
+                bucket = cells.get((x, y))
+                if bucket:
+                    found.update(bucket)
+        sprites = self.sprites
+        return [sprites[idx] for idx in sorted(found)]
+
+    def query_rect(self, rect):
+        """
+        Finds the sprites whose hit_rect overlaps a rect.
+        :param rect: The pg.Rect under consideration.
+        :return: A list of the overlapping sprites.
+        """
+        return [sprite for sprite in self._candidates(rect.left, rect.top, rect.right - 1, rect.bottom - 1)
+                if rect.colliderect(sprite.hit_rect)]
+
+    def query_radius(self, pos, radius):
+        """
+        Finds the sprites within a radius of a point.
+        :param pos: Vector2 of the point.
+        :param radius: The radius in pixels.
+        :return: A list of sprites whose hit_rects come closer than radius to pos.
+        """
+        x, y = pos[0], pos[1]
+        nearby = []
+        for sprite in self._candidates(x - radius, y - radius, x + radius, y + radius):
+            rect = sprite.hit_rect
+            dx = max(rect.left - x, 0, x - rect.right)
+            dy = max(rect.top - y, 0, y - rect.bottom)
+            if dx * dx + dy * dy < radius * radius:
+                nearby.append(sprite)
+        return nearby
@@ -52,11 +52,29 @@ class Wall(Obstacle):
 
 class _Wall(Obstacle):
     """
-    Obstacles used by the mobs for collision avoidance
+    Obstacles used by the mobs for collision avoidance.
+    May span several tiles, in which case it is avoided like a row or block of single tiles.
     """
     def __init__(self, game, x, y, width=TILESIZE, height=TILESIZE):
         super().__init__(game, x, y, width, height)
         self.game._walls.add(self)
+        # The radius of a single tile
+        self.radius = sqrt(2) * TILESIZE
+        # The centres of the tiles the wall covers lie within these bounds
+        self.core_left = self.hit_rect.left + min(TILESIZE, self.hit_rect.width) / 2
+        self.core_right = self.hit_rect.right - min(TILESIZE, self.hit_rect.width) / 2
+        self.core_top = self.hit_rect.top + min(TILESIZE, self.hit_rect.height) / 2
+        self.core_bottom = self.hit_rect.bottom - min(TILESIZE, self.hit_rect.height) / 2
+
+    def nearest_point(self, point):
+        """
+        Finds the centre of the part of the wall nearest a point, treating the
+        wall as a continuous row or block of tiles.
+        :param point: The point under consideration
+        :return: Vector2 of the nearest tile centre. The wall's centre for a single tile.
+        """
+        return vec(min(max(point[0], self.core_left), self.core_right),
+                   min(max(point[1], self.core_top), self.core_bottom))
 
 
 class LevelEnd(Obstacle):
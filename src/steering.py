@@ -0,0 +1,210 @@
+from math import ceil
+try:
+    import numpy as np
+except ImportError:
+    np = None
+from settings import AVOID_RADIUS, APPROACH_RADIUS
+
+# True if the vectorized steering engine can be used
+NUMPY_AVAILABLE = np is not None
+
+
+def _length(vectors):
+    """
+    Finds the length of every row of an (n, 2) array.
+    :param vectors: The array of vectors.
+    :return: An (n, 1) array of lengths.
+    """
+    return np.sqrt((vectors ** 2).sum(axis=1, keepdims=True))
+
+
+def _scale_to(vectors, lengths):
+    """
+    Scales every row of an (n, 2) array to a given length.
+    Rows of length zero are left at zero instead of raising as Vector2.scale_to_length does.
+    :param vectors: The array of vectors.
+    :param lengths: An (n, 1) array or a scalar of the lengths to scale to.
+    :return: The scaled array.
+    """
+    current = _length(vectors)
+    return np.divide(vectors * lengths, current, out=np.zeros_like(vectors), where=current > 0)
+
+
+def _clamp(vectors, lengths):
+    """
+    Shortens the rows of an (n, 2) array which are longer than a given length.
+    :param vectors: The array of vectors.
+    :param lengths: An (n, 1) array of the longest lengths allowed.
+    :return: The clamped array.
+    """
+    return np.where(_length(vectors) > lengths, _scale_to(vectors, lengths), vectors)
+
+
+class SteeringEngine:
+    """
+    Computes the steering forces and movement of every mob at once with NumPy.
+    Each frame the position, velocity, acceleration, speed and seek force of every
+    mob are gathered into arrays, the pursuit, separation, alignment and cohesion
+    forces of the whole horde are found in a few vectorized passes over the pairs
+    of mobs filed under neighbouring cells of a spatial hash, all mobs are moved in a single integration step, and the results are
+    written back to the mobs. Forces that depend on a mob's own surroundings, like
+    obstacle avoidance, wandering and path following, are still applied per mob by
+    Mob.plan before the batched pass.
+    """
+
+    # Index of each behaviour in the weight arrays, as returned by Mob.plan
+    BEHAVIOURS = {'pursue': 0, 'follow': 1, 'wander': 2}
+    PURSUE_WEIGHTS = (3, 0, 0)
+    SEPARATION_WEIGHTS = (2.5, 2, 2)
+
+    def __init__(self):
+        """
+        Creates a new steering engine.
+        """
+        if np is None:
+            raise ImportError('The vectorized steering engine needs NumPy')
+        self.pursue_weights = np.array(self.PURSUE_WEIGHTS, dtype=float)
+        self.separation_weights = np.array(self.SEPARATION_WEIGHTS, dtype=float)
+
+    def update(self, mobs, prey, dt, mob_hash):
+        """
+        Steers and moves every mob.
+        :param mobs: The group of mobs.
+        :param prey: The sprite the mobs pursue.
+        :param dt: The duration of the frame in seconds.
+        :param mob_hash: A SpatialHash of the mobs, rebuilt this frame.
+        :return: None
+        """
+        mobs = mobs.sprites()
+        if not mobs:
+            return
+        behaviours = np.array([self.BEHAVIOURS[mob.plan()] for mob in mobs])
+        pos = np.array([(mob.pos.x, mob.pos.y) for mob in mobs], dtype=float)
+        vel = np.array([(mob.vel.x, mob.vel.y) for mob in mobs], dtype=float)
+        acc = np.array([(mob.acc.x, mob.acc.y) for mob in mobs], dtype=float)
+        speed = np.array([mob.speed for mob in mobs], dtype=float)[:, None]
+        seek_force = np.array([mob.seek_force for mob in mobs], dtype=float)[:, None]
+        radius = np.array([mob.radius for mob in mobs], dtype=float)[:, None]
+        moving = np.array([mob.can_attack for mob in mobs])
+
+        acc += self.pursue(pos, vel, speed, seek_force, prey) * self.pursue_weights[behaviours][:, None]
+        pairs = self.neighbour_pairs(mobs, mob_hash, max(AVOID_RADIUS, 1.5 * radius.max()))
+        cohesion, align, separation = self.flock(pos, vel, speed, seek_force, radius, pairs)
+        acc += separation * self.separation_weights[behaviours][:, None]
+        acc += align
+        acc += cohesion
+
+        vel = _scale_to(vel + acc * dt, speed)
+        pos = np.where(moving[:, None], pos + vel * dt + 0.5 * acc * dt ** 2, pos)
+
+        for mob, p, v, a in zip(mobs, pos.tolist(), vel.tolist(), acc.tolist()):
+            mob.pos.update(p)
+            mob.vel.update(v)
+            mob.acc.update(a)
+
+    @staticmethod
+    def pursue(pos, vel, speed, seek_force, prey):
+        """
+        Vectorized Mob.pursue, steering every mob towards where its prey is heading
+        and slowing down as it approaches.
+        :return: An (n, 2) array of steering forces.
+        """
+        target = np.array((prey.pos.x, prey.pos.y), dtype=float)
+        if prey.vel.length() != 0:
+            heading = prey.vel.normalize()
+            target += (heading.x, heading.y)
+        desired = target - pos
+        dist = _length(desired)
+        desired = _scale_to(desired, np.where(dist < APPROACH_RADIUS, dist / APPROACH_RADIUS * speed, speed))
+        return _clamp(desired - vel, seek_force)
+
+    @staticmethod
+    def neighbour_pairs(mobs, mob_hash, reach):
+        """
+        Finds the pairs of mobs which may be within reach of each other. Only mobs
+        filed under cells of the spatial hash close enough to be in reach are paired,
+        so the number of pairs grows with how crowded the mobs are rather than with
+        the square of their number.
+        :param mobs: The list of mobs, in the order of the arrays.
+        :param mob_hash: A SpatialHash of the mobs, rebuilt this frame.
+        :param reach: The largest distance at which two mobs affect each other.
+        :return: Two arrays of mob indices (i, j), holding each pair both ways round
+        and every mob paired with itself.
+        """
+        index = {mob: idx for idx, mob in enumerate(mobs)}
+        cells = list(mob_hash.cells)
+        buckets = [[index[mob] for mob in mob_hash.cells[cell] if mob in index] for cell in cells]
+        members = np.array([idx for bucket in buckets for idx in bucket], dtype=np.intp)
+        counts = np.array([len(bucket) for bucket in buckets], dtype=np.intp)
+        starts = np.cumsum(counts) - counts
+        if not len(members):
+            return members, members
+
+        # Packs each cell into a sortable key, leaving room for the neighbours' keys
+        span = int(ceil(reach / mob_hash.cell_size))
+        cell_pos = np.array(cells, dtype=np.int64)
+        low = cell_pos.min(axis=0) - span
+        height = cell_pos[:, 1].max() - low[1] + span + 1
+        keys = (cell_pos[:, 0] - low[0]) * height + cell_pos[:, 1] - low[1]
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        home = []
+        other = []
+        for dx in range(-span, span + 1):
+            for dy in range(-span, span + 1):
+                found = np.searchsorted(sorted_keys, keys + dx * height + dy)
+                found = np.minimum(found, len(sorted_keys) - 1)
+                hit = sorted_keys[found] == keys + dx * height + dy
+                home.append(np.flatnonzero(hit))
+                other.append(order[found[hit]])
+        home = np.concatenate(home)
+        other = np.concatenate(other)
+
+        # Every mob of each home cell against every mob of each cell near it
+        sizes = counts[home] * counts[other]
+        cell_pair = np.repeat(np.arange(len(home)), sizes)
+        local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        width = counts[other][cell_pair]
+        i = members[starts[home][cell_pair] + local // width]
+        j = members[starts[other][cell_pair] + local % width]
+        return i, j
+
+    @staticmethod
+    def flock(pos, vel, speed, seek_force, radius, pairs):
+        """
+        Vectorized Mob.cohesion, Mob.align and Mob.separation over pairs of mobs.
+        :param pairs: The (i, j) index arrays of every pair of mobs close enough to
+        affect each other, as returned by neighbour_pairs.
+        :return: The (n, 2) arrays of cohesion, alignment and separation forces.
+        """
+        i, j = pairs
+        # offsets[k] is the vector from mob j[k] to mob i[k]
+        offsets = pos[i] - pos[j]
+        dist = _length(offsets)[:, 0]
+        zero = np.zeros_like(pos)
+        n = len(pos)
+
+        near = (dist > 0) & (dist < AVOID_RADIUS)
+        count = np.bincount(i[near], minlength=n)[:, None]
+        has_neighbours = count > 0
+        total = zero.copy()
+        np.add.at(total, i[near], pos[j[near]])
+        centre = np.divide(total, count, out=zero.copy(), where=has_neighbours)
+        cohesion = _clamp(_scale_to(centre - pos, speed) - vel, seek_force)
+        cohesion = np.where(has_neighbours & (_length(centre) > 0), cohesion, zero)
+
+        total = zero.copy()
+        np.add.at(total, i[near], vel[j[near]])
+        heading = np.divide(total, count, out=zero.copy(), where=has_neighbours)
+        align = _scale_to(heading * speed - vel, seek_force)
+        align = np.where(has_neighbours & (_length(heading) > 0), align, zero)
+
+        crowded = (dist > 0) & (dist < radius[i, 0] * 1.5)
+        count = np.bincount(i[crowded], minlength=n)[:, None]
+        has_neighbours = count > 0
+        total = zero.copy()
+        np.add.at(total, i[crowded], offsets[crowded] / dist[crowded, None])
+        push = np.divide(total, count, out=zero.copy(), where=has_neighbours)
+        separation = _scale_to(push * speed - vel, seek_force)
+        separation = np.where(has_neighbours & (_length(push) > 0), separation, zero)
+        return cohesion, align, separation
@@ -1,27 +1,183 @@
 import pygame as pg
 import pytmx
-from settings import WIDTH, HEIGHT
+from collections import OrderedDict
+from levelcache import TileLayer
+from settings import WIDTH, HEIGHT, MAP_CHUNK_SIZE, MAP_CHUNK_MEMORY
 
 
 class TiledMap:
-    def __init__(self, filename):
-        self.tmxdata = pytmx.load_pygame(filename, pixelalpha=True)
+    def __init__(self, filename, tmxdata=None):
+        # tmxdata is given if the file has already been loaded, see LevelManager
+        self.tmxdata = tmxdata if tmxdata is not None else pytmx.load_pygame(filename, pixelalpha=True)
+        self.tile_layers = [layer for layer in self.tmxdata.visible_layers
+                            if isinstance(layer, (pytmx.TiledTileLayer, TileLayer))]
+        # The passability grid and merged walls, if they were read from a level cache
+        self.wall_layout = getattr(self.tmxdata, 'wall_layout', None)
         self.width = self.tmxdata.width * self.tmxdata.tilewidth
         self.height = self.tmxdata.height * self.tmxdata.tileheight
+        # Largest tile image, which can be bigger than a grid square
+        self.max_tile_width = max([image.get_width() for image in self.tmxdata.images if image] +
+                                  [self.tmxdata.tilewidth])
+        self.max_tile_height = max([image.get_height() for image in self.tmxdata.images if image] +
+                                   [self.tmxdata.tileheight])
 
-    def render(self, surface):
+    def render_area(self, surface, area):
+        """
+        Renders the tiles overlapping part of the map, layer by layer.
+        :param surface: The surface to render onto, its top left corner matching area's.
+        :param area: The pg.Rect of the map to render, in pixels.
+        :return: None
+        """
         ti = self.tmxdata.get_tile_image_by_gid
-        for layer in self.tmxdata.visible_layers:
-            if isinstance(layer, pytmx.TiledTileLayer):
-                for x, y, gid, in layer:
-                    tile = ti(gid)
+        tilewidth = self.tmxdata.tilewidth
+        tileheight = self.tmxdata.tileheight
+        for layer in self.tile_layers:
+            # Tiles can be larger than the grid, so tiles starting a little
+            # above or to the left of the area may still reach into it
+            left = max(0, (area.left - self.max_tile_width) // tilewidth)
+            top = max(0, (area.top - self.max_tile_height) // tileheight)
+            right = min(layer.width, (area.right - 1) // tilewidth + 1)
+            bottom = min(layer.height, (area.bottom - 1) // tileheight + 1)
+            for y in range(top, bottom):
+                row = layer.data[y]
+                for x in range(left, right):
+                    tile = ti(row[x])
                     if tile:
-                        surface.blit(tile, (x * self.tmxdata.tilewidth, y * self.tmxdata.tileheight))
+                        surface.blit(tile, (x * tilewidth - area.left, y * tileheight - area.top))
+
+
+class MapChunks:
+    """
+    The map image split into square chunks which are rendered on demand.
+    Instead of baking every tile of the level into one surface the size of the
+    map, a chunk is only rendered the first time part of it is drawn, or shortly
+    before as the camera approaches it. Rendered chunks are kept in a least
+    recently used cache, so the memory taken is bounded by max_memory however
+    large the map is. Images stamped onto the map, like blood splats, are kept so
+    that chunks dropped from the cache come back with them.
+    """
+
+    def __init__(self, tiled_map, chunk_size=MAP_CHUNK_SIZE, max_memory=MAP_CHUNK_MEMORY):
+        """
+        Creates the chunks of a map without rendering any of them.
+        :param tiled_map: The TiledMap to render.
+        :param chunk_size: The width and height of a chunk in pixels.
+        :param max_memory: Most bytes the rendered chunks may take.
+        """
+        self.map = tiled_map
+        self.chunk_size = chunk_size
+        self.max_memory = max_memory
+        self.rect = pg.Rect(0, 0, tiled_map.width, tiled_map.height)
+        # (chunk x, chunk y) -> rendered surface
+        self.chunks = OrderedDict()
+        # (chunk x, chunk y) -> list of (image, map position) stamped onto it
+        self.stamps = {}
+        self.memory = 0
+        self.renders = 0
+
+    def _keys(self, rect):
+        """
+        Finds the chunks overlapping part of the map.
+        :param rect: The pg.Rect of the map, in pixels.
+        :return: A list of (chunk x, chunk y).
+        """
+        rect = rect.clip(self.rect)
+        if not rect.width or not rect.height:
+            return []
+        size = self.chunk_size
+        return [(x, y) for y in range(rect.top // size, (rect.bottom - 1) // size + 1)
+                for x in range(rect.left // size, (rect.right - 1) // size + 1)]
 
-    def make_map(self):
-        temp_surface = pg.Surface((self.width, self.height))
-        self.render(temp_surface)
-        return temp_surface
+    def _area(self, key):
+        size = self.chunk_size
+        return pg.Rect(key[0] * size, key[1] * size, size, size).clip(self.rect)
+
+    def _render(self, key):
+        """
+        Renders a chunk and adds it to the cache, dropping the least recently used
+        chunks if they no longer fit.
+        :param key: The (chunk x, chunk y) to render.
+        :return: The rendered surface.
+        """
+        area = self._area(key)
+        chunk = pg.Surface(area.size).convert()
+        self.map.render_area(chunk, area)
+        for image, pos in self.stamps.get(key, ()):
+            chunk.blit(image, (pos[0] - area.x, pos[1] - area.y))
+        self.chunks[key] = chunk
+        self.memory += chunk.get_width() * chunk.get_height() * chunk.get_bytesize()
+        self.renders += 1
+        while self.memory > self.max_memory and len(self.chunks) > 1:
+            _, dropped = self.chunks.popitem(last=False)
+            self.memory -= dropped.get_width() * dropped.get_height() * dropped.get_bytesize()
+        return chunk
+
+    def get(self, key):
+        """
+        Finds a chunk, rendering it if it isn't cached.
+        :param key: The (chunk x, chunk y) of the chunk.
+        :return: The rendered surface.
+        """
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return self._render(key)
+        self.chunks.move_to_end(key)
+        return chunk
+
+    def draw(self, surface, offset, area=None):
+        """
+        Draws the chunks that can be seen.
+        :param surface: The surface to draw onto, usually the screen.
+        :param offset: The (x, y) offset from map to surface coordinates, such as Camera.camera.topleft.
+        :param area: The rect of the surface to draw, or None for all of it.
+        :return: None
+        """
+        if area is None:
+            area = surface.get_rect()
+        visible = area.move(-offset[0], -offset[1])
+        for key in self._keys(visible):
+            chunk_area = self._area(key)
+            part = visible.clip(chunk_area)
+            surface.blit(self.get(key), (part.x + offset[0], part.y + offset[1]),
+                         part.move(-chunk_area.x, -chunk_area.y))
+
+    def prefetch(self, rect, limit=1):
+        """
+        Renders chunks that aren't cached yet ahead of them being drawn.
+        :param rect: The pg.Rect of the map about to be seen, such as Camera.visible_rect with a margin.
+        :param limit: Most chunks to render, to spread the work over several frames.
+        :return: None
+        """
+        for key in self._keys(rect):
+            if limit <= 0:
+                return
+            if key not in self.chunks:
+                self._render(key)
+                limit -= 1
+
+    def stamp(self, image, pos):
+        """
+        Draws an image onto the map for the rest of the level.
+        :param image: The image to draw.
+        :param pos: The (x, y) map position of its top left corner.
+        :return: None
+        """
+        for key in self._keys(image.get_rect(topleft=pos)):
+            self.stamps.setdefault(key, []).append((image, pos))
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                area = self._area(key)
+                chunk.blit(image, (pos[0] - area.x, pos[1] - area.y))
+
+    def stats(self):
+        """
+        Reports the size of the cache.
+        :return: A dictionary of the cached chunk count, memory use in bytes and chunks rendered so far.
+        """
+        return {'chunks': len(self.chunks),
+                'memory': self.memory,
+                'max memory': self.max_memory,
+                'renders': self.renders}
 
 
 class Camera:
@@ -48,6 +204,14 @@ class Camera:
         return [point[0] + self.camera.x, point[1] + self.camera.y]
 
 
+    def visible_rect(self, margin=0):
+        """
+        Finds the part of the world the camera shows
+        :param margin: Pixels to grow the rect by on every side
+        :return: The world rect shown on the screen
+        """
+        return pg.Rect(-self.camera.x - margin, -self.camera.y - margin, WIDTH + 2 * margin, HEIGHT + 2 * margin)
+
     def apply_rect(self, rect, copy=False):
         """
         Applies the camera's focus on the target rectangle